@@ -1,17 +1,69 @@
+"""HTTP API для Mini App.
+
+Запуск: python api.py (uvicorn, API_WORKERS процессов) или
+uvicorn api:app --workers N. Каждый процесс держит один асинхронный
+клиент Supabase (общий пул соединений, как в боте, см. db.py) и свой
+кэш снимков ответов. Если задан DATABASE_URL, проекты читаются напрямую
+из Postgres через пул asyncpg (см. pg_store.py).
+"""
+import asyncio
 import os
+from contextlib import asynccontextmanager
+
 from dotenv import load_dotenv
-from supabase import create_client, Client
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 
+import db
+from api_cache import Snapshot, SnapshotCache, etag_matches
+from pg_store import PgStore
+
 load_dotenv()
 
-# Инициализация Supabase
 url: str = os.getenv("SUPABASE_URL")
 key: str = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
+DATABASE_URL = os.getenv("DATABASE_URL", "")  # postgresql://... — читать проекты через asyncpg, а не PostgREST
+PG_POOL_SIZE = int(os.getenv("PG_POOL_SIZE", 10))  # Соединений asyncpg на процесс
+
+# --- ЗАПУСК ---
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", 8000))
+API_WORKERS = int(os.getenv("API_WORKERS", 1))  # Процессов uvicorn (обычно по числу ядер)
+API_DB_CONCURRENCY = int(os.getenv("API_DB_CONCURRENCY", 20))  # Одновременных запросов к базе на процесс
+
+# --- КЭШ ОТВЕТОВ (см. api_cache.py) ---
+API_CACHE_TTL = int(os.getenv("API_CACHE_TTL", 15))  # Через сколько секунд снимок перестраивается в фоне
+API_STALE_WHILE_REVALIDATE = int(os.getenv("API_STALE_WHILE_REVALIDATE", 60))  # Сколько можно отдавать старый ответ
+API_CACHE_SIZE = int(os.getenv("API_CACHE_SIZE", 256))  # Снимков (страниц и карточек) в памяти
+
+# --- СПИСОК ПРОЕКТОВ ---
+PAGE_SIZE_DEFAULT = 20
+PAGE_SIZE_MAX = 100
+# Колонки, которые можно запросить через fields; по умолчанию — все поля карточки
+PROJECT_FIELDS = ("id", "name", "description", "category", "score")
+
+snapshots = SnapshotCache(API_CACHE_TTL, API_STALE_WHILE_REVALIDATE, API_CACHE_SIZE)
+# Лишние сборки снимков ждут здесь, а не в очереди пула соединений
+db_slots = asyncio.Semaphore(API_DB_CONCURRENCY)
+# Откуда читаются проекты: модуль db (Supabase) или PgStore — функции одинаковые
+store = db
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global store
+    if DATABASE_URL:
+        store = PgStore(DATABASE_URL, min_size=min(2, PG_POOL_SIZE), max_size=PG_POOL_SIZE)
+        await store.start()
+    else:
+        # Инициализация Supabase (асинхронный клиент на процесс)
+        await db.init_db(url, key)
+    yield
+    if store is not db:
+        await store.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Разрешаем запросы с фронтенда (CORS)
 app.add_middleware(
@@ -19,13 +71,98 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+
+def snapshot_response(request: Request, snapshot: Snapshot) -> Response:
+    """200 с телом снимка или 304, если у клиента та же версия"""
+    headers = {
+        "ETag": snapshot.etag,
+        "Cache-Control": f"public, max-age={API_CACHE_TTL}, stale-while-revalidate={API_STALE_WHILE_REVALIDATE}",
+    }
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+
+def parse_fields(fields: str):
+    """fields=name,score -> колонки выборки; id и score нужны всегда (курсор)"""
+    if not fields:
+        return PROJECT_FIELDS
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in PROJECT_FIELDS]
+    if unknown:
+        raise HTTPException(400, f"Неизвестные поля: {', '.join(unknown)}")
+    return tuple(field for field in PROJECT_FIELDS if field in requested or field in ("id", "score"))
+
+
+def parse_cursor(after: str):
+    """Курсор "score,id" последнего проекта предыдущей страницы"""
+    if not after:
+        return None
+    try:
+        score, last_id = after.split(",")
+        return int(score), int(last_id)
+    except ValueError:
+        raise HTTPException(400, "Неверный курсор after")
+
+
+async def load_projects_page(category, limit: int, after, columns):
+    """Страница по ключу (score DESC, id ASC): читается limit + 1 строка, а не весь каталог"""
+    async with db_slots:
+        rows = await store.list_projects_page(category, after, limit + 1, ",".join(columns))
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = f"{last['score']},{last['id']}"
+    return {"items": items, "next": next_cursor}
+
+
+async def load_project(project_id: int):
+    async with db_slots:
+        return await store.get_project(project_id, ",".join(PROJECT_FIELDS))
+
+
 @app.get("/api/projects")
-async def get_projects():
+async def get_projects(
+    request: Request,
+    category: str = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    after: str = None,
+    fields: str = None,
+):
+    """Страница проектов по убыванию рейтинга: {"items": [...], "next": курсор или null}"""
+    columns = parse_fields(fields)
+    cursor = parse_cursor(after)
     try:
-        # Запрос к таблице через API SDK
-        response = supabase.table("projects").select("*").execute()
-        return response.data
+        # Одинаковые запросы отдаются из снимка, база видит только его пересборку
+        snapshot = await snapshots.get(
+            ("list", category, limit, cursor, columns),
+            lambda: load_projects_page(category, limit, cursor, columns)
+        )
+        return snapshot_response(request, snapshot)
     except Exception as e:
         return {"error": str(e)}
+
+
+@app.get("/api/projects/{project_id}")
+async def get_project(request: Request, project_id: int):
+    """Карточка одного проекта"""
+    try:
+        snapshot = await snapshots.get(
+            ("project", project_id),
+            lambda: load_project(project_id)
+        )
+    except Exception as e:
+        return {"error": str(e)}
+    if snapshot.empty:
+        raise HTTPException(404, "Проект не найден")
+    return snapshot_response(request, snapshot)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("api:app", host=API_HOST, port=API_PORT, workers=API_WORKERS)
@@ -0,0 +1,105 @@
+"""Снимки ответов API в памяти процесса.
+
+Снимок — готовое тело JSON-ответа и его ETag для одного запроса (страница
+списка, карточка проекта). Повторные запросы, даже пачкой при открытии
+Mini App, не доходят до базы и не сериализуют данные заново. Снимок
+старше ttl отдается как есть и перестраивается в фоне
+(stale-while-revalidate); старше ttl + max_stale — строится заново до
+ответа. ETag — хэш тела: пока данные не изменились, клиент с
+If-None-Match получает 304 без тела. Если база недоступна, отдается
+последний удачный снимок.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Есть ли etag в заголовке If-None-Match (слабые W/ тоже совпадают)"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class Snapshot:
+    """Тело ответа load() в JSON, ETag и время сборки"""
+
+    def __init__(self, load, ttl: float = 15, max_stale: float = 60):
+        self._load = load  # корутина без аргументов, возвращает данные ответа
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.body = None
+        self.etag = None
+        self.empty = False  # load() вернул None (например, проекта нет)
+        self.built_at = 0.0
+        self._lock = asyncio.Lock()
+        self._revalidating = None
+
+    async def refresh(self):
+        """Перестраивает снимок (одновременно — только одна сборка)"""
+        async with self._lock:
+            await self._build()
+
+    async def _build(self):
+        data = await self._load()
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+        # Поля подменяются вместе, между ними нет await
+        self.etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        self.body = body
+        self.empty = data is None
+        self.built_at = time.monotonic()
+
+    async def _revalidate(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logging.error(f"Ошибка обновления снимка API: {e}")
+        finally:
+            self._revalidating = None
+
+    async def get(self):
+        """Текущий снимок; отсутствующий или слишком старый строится до ответа"""
+        age = time.monotonic() - self.built_at
+        if self.body is None or age > self.ttl + self.max_stale:
+            built_at = self.built_at
+            async with self._lock:
+                # Пока ждали блокировку, снимок мог собрать другой запрос
+                if self.built_at == built_at:
+                    try:
+                        await self._build()
+                    except Exception as e:
+                        if self.body is None:
+                            raise
+                        logging.error(f"Ошибка обновления снимка API, отдаем старый: {e}")
+        elif age > self.ttl and self._revalidating is None:
+            self._revalidating = asyncio.create_task(self._revalidate())
+        return self
+
+
+class SnapshotCache:
+    """LRU снимков по ключу запроса"""
+
+    def __init__(self, ttl: float = 15, max_stale: float = 60, max_size: int = 256):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_size = max_size
+        self._items = OrderedDict()  # ключ -> Snapshot
+
+    async def get(self, key, load):
+        """Снимок для ключа; load() вызывается, только когда его нужно собрать"""
+        snapshot = self._items.get(key)
+        if snapshot is None:
+            snapshot = self._items[key] = Snapshot(load, self.ttl, self.max_stale)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        else:
+            self._items.move_to_end(key)
+        return await snapshot.get()
+
+    def __len__(self):
+        return len(self._items)
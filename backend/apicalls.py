@@ -0,0 +1,33 @@
+"""Подсчет вызовов Bot API в пределах одного обработчика.
+
+Middleware сессии бота считает запросы к Telegram в текущем контексте
+asyncio, поэтому параллельные апдейты не смешиваются.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+
+class ApiCallCounter(BaseRequestMiddleware):
+    """Считает вызовы Bot API внутри блока measure()"""
+
+    def __init__(self):
+        self._current = ContextVar("api_calls", default=None)
+
+    async def __call__(self, make_request, bot, method):
+        calls = self._current.get()
+        if calls is not None:
+            calls[type(method).__name__] += 1
+        return await make_request(bot, method)
+
+    @contextmanager
+    def measure(self):
+        """with counter.measure() as calls: ... — calls заполняется по ходу блока"""
+        calls = Counter()
+        token = self._current.set(calls)
+        try:
+            yield calls
+        finally:
+            self._current.reset(token)
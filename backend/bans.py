@@ -0,0 +1,83 @@
+"""Индекс забаненных пользователей в памяти процесса.
+
+Загружается из banned_users при старте, обновляется командами /ban и
+/unban и периодически полностью пересинхронизируется с базой, чтобы
+подхватывать баны, измененные напрямую в БД.
+"""
+import asyncio
+import logging
+
+import db
+
+
+class BanIndex:
+    """user_id -> строка banned_users, проверка за O(1) без сети"""
+
+    def __init__(self):
+        self._bans = {}
+        self.loaded = False
+        # Номер локального изменения; пока идут загрузки, изменения
+        # запоминаются (user_id -> (номер, бан или None)), чтобы не потерять их
+        self._generation = 0
+        self._loading = 0
+        self._changes = {}
+
+    def get(self, user_id: int):
+        """Запись о бане или None"""
+        return self._bans.get(user_id)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._bans
+
+    def __len__(self):
+        return len(self._bans)
+
+    def add(self, ban: dict):
+        """Добавляет бан (после успешной вставки в базу)"""
+        self._bans[ban['user_id']] = ban
+        self._changed(ban['user_id'], ban)
+
+    def remove(self, user_id: int):
+        """Снимает бан (после удаления из базы)"""
+        self._bans.pop(user_id, None)
+        self._changed(user_id, None)
+
+    def _changed(self, user_id: int, ban):
+        self._generation += 1
+        if self._loading:
+            self._changes[user_id] = (self._generation, ban)
+
+    async def load(self):
+        """Полностью перечитывает бан-лист из базы"""
+        generation = self._generation
+        self._loading += 1
+        try:
+            bans = await db.list_bans()
+            fresh = {ban['user_id']: ban for ban in bans}
+            # /ban и /unban во время чтения могли не попасть в выборку:
+            # накладываем их поверх, иначе подмена откатит свежий бан
+            if self._generation != generation:
+                for user_id, (changed_at, ban) in self._changes.items():
+                    if changed_at <= generation:
+                        continue
+                    if ban is None:
+                        fresh.pop(user_id, None)
+                    else:
+                        fresh[user_id] = ban
+            # Подменяем словарь целиком, чтобы проверки не видели промежуточное состояние
+            self._bans = fresh
+            self.loaded = True
+            return len(self._bans)
+        finally:
+            self._loading -= 1
+            if not self._loading:
+                self._changes.clear()
+
+    async def refresh_forever(self, interval: float):
+        """Фоновая пересинхронизация с banned_users"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.load()
+            except Exception as e:
+                logging.error(f"Ошибка обновления бан-листа: {e}")
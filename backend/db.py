@@ -0,0 +1,365 @@
+"""Асинхронный слой доступа к данным (Supabase / PostgREST).
+
+Все обращения к базе из бота идут через этот модуль. Клиент асинхронный,
+поэтому запросы не блокируют цикл событий aiogram и несколько апдейтов
+могут ждать ответа базы одновременно.
+"""
+import logging
+from supabase import acreate_client, AsyncClient
+
+_client: AsyncClient = None
+
+
+async def init_db(url: str, key: str):
+    """Создает асинхронный клиент Supabase (вызывается один раз при старте)"""
+    global _client
+    if _client is None:
+        _client = await acreate_client(url, key)
+        logging.info("Асинхронный клиент Supabase инициализирован")
+    return _client
+
+
+def get_client() -> AsyncClient:
+    """Возвращает инициализированный клиент"""
+    if _client is None:
+        raise RuntimeError("База не инициализирована: вызовите init_db()")
+    return _client
+
+
+def _table(name: str):
+    return get_client().table(name)
+
+
+def _first(result):
+    """Первая строка результата или None"""
+    return result.data[0] if result.data else None
+
+
+async def stream(make_query, key: str, chunk_size: int = 1000):
+    """Асинхронный генератор: строки запроса кусками по chunk_size (пагинация по ключу).
+    
+    make_query() каждый раз строит новый запрос (select + фильтры) без
+    order/limit. key — уникальная неизменяемая колонка (id, user_id): строки
+    идут по возрастанию key, следующий кусок начинается после последнего
+    значения, поэтому вставки и изменения других колонок между кусками
+    не приводят к пропускам и повторам (в отличие от OFFSET).
+    chunk_size не больше лимита PostgREST (max-rows, в Supabase 1000).
+    """
+    last = None
+    while True:
+        query = make_query()
+        if last is not None:
+            query = query.gt(key, last)
+        result = await query.order(key).limit(chunk_size).execute()
+        rows = result.data or []
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1][key]
+
+
+# --- PROJECTS ---
+def _projects(columns: str = "*", **kwargs):
+    """select по проектам без удаленных (deleted_at, см. migrations/006)"""
+    return _table("projects").select(columns, **kwargs).is_("deleted_at", "null")
+
+
+async def get_project(project_id: int, columns: str = "*"):
+    """Проект по ID"""
+    result = await _projects(columns).eq("id", project_id).execute()
+    return _first(result)
+
+
+async def get_project_by_exact_name(name: str):
+    """Проект с точным совпадением названия"""
+    result = await _projects().eq("name", name).execute()
+    return _first(result)
+
+
+async def find_project_by_name(name: str):
+    """Первый проект, в названии которого встречается строка"""
+    result = await _projects().ilike("name", f"%{name}%").execute()
+    return _first(result)
+
+
+async def search_projects(query: str, limit: int = 10):
+    """Поиск проектов по части названия, по убыванию рейтинга"""
+    result = await _projects()\
+        .ilike("name", f"%{query}%")\
+        .order("score", desc=True)\
+        .limit(limit)\
+        .execute()
+    return result.data or []
+
+
+async def list_category_page(category: str, after=None, limit: int = 5):
+    """Страница проектов категории по ключу (score DESC, id ASC).
+    
+    after — курсор (score, id) последнего проекта предыдущей страницы.
+    Возвращает (проекты, count), где count — число проектов начиная с курсора,
+    посчитанное тем же запросом.
+    """
+    query = _projects("*", count="exact")\
+        .eq("category", category)
+    result = await _keyset_page(query, after, limit).execute()
+    return result.data or [], result.count or 0
+
+
+async def list_projects_page(category: str = None, after=None, limit: int = 20, columns: str = "*"):
+    """Страница проектов (всех или одной категории) по ключу (score DESC, id ASC)
+    без подсчета общего числа; after — курсор (score, id), как в list_category_page"""
+    query = _projects(columns)
+    if category:
+        query = query.eq("category", category)
+    result = await _keyset_page(query, after, limit).execute()
+    return result.data or []
+
+
+def _keyset_page(query, after, limit: int):
+    """Проекты после курсора (score, id) в порядке score DESC, id ASC"""
+    if after is not None:
+        score, last_id = after
+        query = query.or_(f"score.lt.{score},and(score.eq.{score},id.gt.{last_id})")
+    return query\
+        .order("score", desc=True)\
+        .order("id")\
+        .limit(limit)
+
+
+async def get_projects_by_ids(project_ids):
+    """Проекты по списку ID одним запросом"""
+    if not project_ids:
+        return []
+    result = await _projects().in_("id", list(project_ids)).execute()
+    return result.data or []
+
+
+async def list_top_projects(limit: int):
+    """Лучшие проекты по рейтингу"""
+    result = await _projects().order("score", desc=True).limit(limit).execute()
+    return result.data or []
+
+
+async def list_all_projects():
+    """Все проекты по возрастанию id (без обрезки по лимиту PostgREST)"""
+    rows = []
+    async for chunk in iter_projects():
+        rows.extend(chunk)
+    return rows
+
+
+def iter_projects(chunk_size: int = 1000):
+    """Все проекты по возрастанию id, кусками (score меняется, по нему листать нельзя)"""
+    return stream(lambda: _projects(), "id", chunk_size)
+
+
+async def insert_project(fields: dict):
+    """Создает проект и возвращает созданную строку"""
+    result = await _table("projects").insert(fields).execute()
+    return _first(result)
+
+
+async def update_project(project_id: int, fields: dict):
+    """Обновляет поля проекта"""
+    await _table("projects").update(fields).eq("id", project_id).execute()
+
+
+# --- USER_LOGS ---
+async def get_user_action(user_id: int, project_id: int, action_type: str):
+    """Отзыв или лайк пользователя для проекта"""
+    result = await _table("user_logs")\
+        .select("*")\
+        .eq("user_id", user_id)\
+        .eq("project_id", project_id)\
+        .eq("action_type", action_type)\
+        .limit(1)\
+        .execute()
+    return _first(result)
+
+
+async def list_project_logs(project_id: int, action_type: str = None, limit: int = None):
+    """Записи user_logs проекта, новые первыми"""
+    query = _table("user_logs").select("*").eq("project_id", project_id)
+    if action_type:
+        query = query.eq("action_type", action_type)
+    query = query.order("created_at", desc=True)
+    if limit:
+        query = query.limit(limit)
+    result = await query.execute()
+    return result.data or []
+
+
+# --- RATING_HISTORY ---
+async def insert_history(fields: dict):
+    """Добавляет запись в историю рейтинга"""
+    result = await _table("rating_history").insert(fields).execute()
+    return _first(result)
+
+
+async def list_history(project_id: int, limit: int = None):
+    """История изменений проекта, новые первыми"""
+    query = _table("rating_history")\
+        .select("*")\
+        .eq("project_id", project_id)\
+        .order("created_at", desc=True)
+    if limit:
+        query = query.limit(limit)
+    result = await query.execute()
+    return result.data or []
+
+
+async def list_history_changes_since(since: str, chunk_size: int = 1000):
+    """project_id, change_amount, created_at всех изменений с указанной даты"""
+    rows = []
+    query = lambda: _table("rating_history")\
+        .select("id, project_id, change_amount, created_at")\
+        .gte("created_at", since)
+    async for chunk in stream(query, "id", chunk_size):
+        rows.extend(chunk)
+    return rows
+
+
+# --- BANNED_USERS ---
+async def get_ban(user_id: int):
+    """Запись о бане пользователя или None"""
+    result = await _table("banned_users").select("*").eq("user_id", user_id).execute()
+    return _first(result)
+
+
+async def list_bans():
+    """Все баны (для индекса в памяти)"""
+    rows = []
+    async for chunk in iter_bans():
+        rows.extend(chunk)
+    return rows
+
+
+def iter_bans(chunk_size: int = 1000):
+    """Баны по возрастанию user_id, кусками"""
+    return stream(lambda: _table("banned_users").select("*"), "user_id", chunk_size)
+
+
+async def insert_ban(fields: dict):
+    """Добавляет бан и возвращает созданную строку"""
+    result = await _table("banned_users").insert(fields).execute()
+    return _first(result)
+
+
+async def delete_ban(user_id: int):
+    """Снимает бан"""
+    await _table("banned_users").delete().eq("user_id", user_id).execute()
+
+
+# --- PROJECT_PHOTOS ---
+async def get_project_photos(project_ids) -> dict:
+    """file_id фото для нескольких проектов одним запросом: project_id -> file_id"""
+    if not project_ids:
+        return {}
+    result = await _table("project_photos")\
+        .select("project_id, photo_file_id")\
+        .in_("project_id", list(project_ids))\
+        .execute()
+    return {row['project_id']: row.get('photo_file_id') for row in result.data or []}
+
+
+async def upsert_project_photo(fields: dict):
+    """Сохраняет (или заменяет) фото проекта"""
+    await _table("project_photos").upsert(fields).execute()
+
+
+# --- АТОМАРНЫЕ ИЗМЕНЕНИЯ РЕЙТИНГА (RPC, см. migrations/002) ---
+async def _rpc(name: str, params: dict):
+    result = await get_client().rpc(name, params).execute()
+    return _first(result)
+
+
+async def submit_review(project_id: int, user_id: int, username: str, review_text: str, rating: int):
+    """Новый/измененный отзыв + score + история одной транзакцией (None, если проекта нет)"""
+    return await _rpc("submit_review", {
+        "p_project_id": project_id,
+        "p_user_id": user_id,
+        "p_username": username,
+        "p_review_text": review_text,
+        "p_rating": rating,
+    })
+
+
+async def add_like(project_id: int, user_id: int, username: str):
+    """Лайк + score + история одной транзакцией; liked=False, если лайк уже был"""
+    return await _rpc("add_like", {
+        "p_project_id": project_id,
+        "p_user_id": user_id,
+        "p_username": username,
+    })
+
+
+async def admin_change_score(project_id: int, admin_id: int, admin_username: str, amount: int, reason: str):
+    """Ручное изменение рейтинга + история одной транзакцией"""
+    return await _rpc("admin_change_score", {
+        "p_project_id": project_id,
+        "p_admin_id": admin_id,
+        "p_admin_username": admin_username,
+        "p_amount": amount,
+        "p_reason": reason,
+    })
+
+
+async def delete_review(log_id: int, admin_id: int, admin_username: str):
+    """Удаление отзыва с откатом рейтинга одной транзакцией (None, если отзыва нет)"""
+    return await _rpc("delete_review", {
+        "p_log_id": log_id,
+        "p_admin_id": admin_id,
+        "p_admin_username": admin_username,
+    })
+
+
+# --- АГРЕГАТЫ (см. migrations/003) ---
+async def get_project_stats(project_id: int):
+    """Отзывы, лайки, средняя оценка, распределение 1-5 и длина истории одной строкой"""
+    return await _rpc("project_stats", {"p_project_id": project_id})
+
+
+# --- PROJECT_COUNTERS (см. migrations/004) ---
+async def get_project_counters_many(project_ids) -> dict:
+    """Счетчики нескольких проектов одним запросом: project_id -> строка project_counters"""
+    if not project_ids:
+        return {}
+    result = await _table("project_counters").select("*").in_("project_id", list(project_ids)).execute()
+    return {row['project_id']: row for row in result.data or []}
+
+
+async def reconcile_project_counters() -> int:
+    """Пересобирает project_counters из user_logs, возвращает число проектов"""
+    result = await get_client().rpc("reconcile_project_counters", {}).execute()
+    return result.data or 0
+
+
+# --- АКТИВНОСТЬ ПОЛЬЗОВАТЕЛЕЙ (см. migrations/005) ---
+async def find_user_activity(user_id: int = None, username: str = None):
+    """Отзывы, лайки, последняя активность, проекты и бан пользователя одной строкой.
+    
+    Ищет по user_id или по username из rating_history; None, если username не найден.
+    """
+    return await _rpc("find_user_activity", {"p_user_id": user_id, "p_username": username})
+
+
+# --- УДАЛЕНИЕ ПРОЕКТОВ (см. migrations/006) ---
+async def delete_project(project_id: int, admin_id: int, admin_username: str, inline_limit: int = 1000):
+    """Удаляет проект одной транзакцией (None, если проекта нет).
+    
+    Возвращает название, категорию, рейтинг и число отзывов. purged=False —
+    отзывов и истории больше inline_limit, их удалит purge_deleted_projects.
+    """
+    return await _rpc("delete_project", {
+        "p_project_id": project_id,
+        "p_admin_id": admin_id,
+        "p_admin_username": admin_username,
+        "p_inline_limit": inline_limit,
+    })
+
+
+async def purge_deleted_projects(batch: int = 1000) -> int:
+    """Одна пачка фоновой очистки удаленных проектов, возвращает число удаленных строк"""
+    result = await get_client().rpc("purge_deleted_projects", {"p_batch": batch}).execute()
+    return result.data or 0
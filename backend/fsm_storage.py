@@ -0,0 +1,215 @@
+"""Постоянные хранилища FSM вместо MemoryStorage.
+
+Черновики отзывов и админских действий переживают перезапуск, а с Redis
+их видят все воркеры бота. У каждого ключа свой TTL: брошенный черновик
+сам исчезает через ttl секунд после последнего изменения.
+
+Помимо стандартного интерфейса BaseStorage хранилища умеют update_state:
+сменить состояние и дописать поля данных одной операцией (один round trip
+в Redis, одна транзакция в SQLite). Хендлеры вызывают его через
+advance_state(), которая для MemoryStorage падает обратно на
+update_data + set_state.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StorageKey
+
+
+def _state_name(state):
+    return state.state if isinstance(state, State) else state
+
+
+async def advance_state(context: FSMContext, new_state, **data):
+    """Переход в new_state с дописыванием data одной записью в хранилище"""
+    storage = context.storage
+    if hasattr(storage, "update_state"):
+        await storage.update_state(context.key, new_state, data)
+        return
+    if data:
+        await context.update_data(**data)
+    await context.set_state(new_state)
+
+
+class SQLiteFSMStorage(BaseStorage):
+    """FSM в локальном SQLite-файле (для одного инстанса бота)
+
+    Запросы выполняются в потоках (asyncio.to_thread) на одном соединении,
+    поэтому каждое обращение к нему идет под блокировкой. Истекшие строки
+    удаляются при старте и не чаще раза в purge_interval секунд при записи.
+    """
+
+    def __init__(self, path: str, ttl: int = None, purge_interval: float = 600):
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._key_builder = DefaultKeyBuilder(with_destiny=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            " key TEXT PRIMARY KEY,"
+            " state TEXT,"
+            " data TEXT NOT NULL DEFAULT '{}',"
+            " expires_at REAL)"
+        )
+        # Черновики, брошенные до перезапуска
+        self._purge_expired()
+        self._conn.commit()
+
+    def _purge_expired(self):
+        # Вызывается под блокировкой (или до того, как соединение стало общим)
+        now = time.time()
+        self._conn.execute("DELETE FROM fsm WHERE expires_at < ?", (now,))
+        self._purged_at = now
+
+    def _maybe_purge(self):
+        if time.time() - self._purged_at >= self.purge_interval:
+            self._purge_expired()
+
+    def _key(self, key: StorageKey) -> str:
+        return self._key_builder.build(key, "state")
+
+    def _expires_at(self):
+        return time.time() + self.ttl if self.ttl else None
+
+    def _select(self, key: str):
+        return self._conn.execute(
+            "SELECT state, data FROM fsm WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+
+    def _read(self, key: str):
+        with self._lock:
+            return self._select(key)
+
+    def _write(self, sql: str, params):
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._maybe_purge()
+            self._conn.commit()
+
+    def _merge(self, key: str, state, data: dict):
+        # Слияние как у update_data в aiogram: верхний уровень, None остается значением.
+        # Истекший черновик не сливаем со свежими данными (_select его не вернет)
+        with self._lock:
+            row = self._select(key)
+            merged = json.loads(row[1]) if row else {}
+            merged.update(data)
+            self._conn.execute(
+                "INSERT INTO fsm (key, state, data, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data,"
+                " expires_at = excluded.expires_at",
+                (key, _state_name(state), json.dumps(merged, ensure_ascii=False), self._expires_at())
+            )
+            self._maybe_purge()
+            self._conn.commit()
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        await asyncio.to_thread(
+            self._write,
+            "INSERT INTO fsm (key, state, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET state = excluded.state, expires_at = excluded.expires_at",
+            (self._key(key), _state_name(state), self._expires_at())
+        )
+
+    async def get_state(self, key: StorageKey):
+        row = await asyncio.to_thread(self._read, self._key(key))
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: dict) -> None:
+        await asyncio.to_thread(
+            self._write,
+            "INSERT INTO fsm (key, data, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at",
+            (self._key(key), json.dumps(data, ensure_ascii=False), self._expires_at())
+        )
+
+    async def get_data(self, key: StorageKey) -> dict:
+        row = await asyncio.to_thread(self._read, self._key(key))
+        return json.loads(row[1]) if row else {}
+
+    async def update_state(self, key: StorageKey, state, data: dict) -> None:
+        """Новое состояние + слияние data с текущими данными одной транзакцией"""
+        await asyncio.to_thread(self._merge, self._key(key), state, data)
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisFSMStorage(BaseStorage):
+    """FSM в Redis (общая для нескольких воркеров).
+
+    Состояние — строка, данные — hash с JSON-значениями полей, поэтому
+    дописать поля можно без чтения. Принимает любой клиент с интерфейсом
+    redis.asyncio (в том числе fakeredis для локальной проверки).
+    """
+
+    def __init__(self, redis, ttl: int = None, prefix: str = "fsm"):
+        self.redis = redis
+        self.ttl = ttl
+        self._key_builder = DefaultKeyBuilder(prefix=prefix, with_destiny=True)
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs):
+        try:
+            from redis.asyncio import Redis
+        except ImportError:
+            raise RuntimeError("Для FSM_STORAGE=redis установите пакет redis")
+        return cls(Redis.from_url(url, decode_responses=True), **kwargs)
+
+    def _keys(self, key: StorageKey):
+        return self._key_builder.build(key, "state"), self._key_builder.build(key, "data")
+
+    def _set_state(self, pipe, state_key: str, state):
+        state = _state_name(state)
+        if state is None:
+            pipe.delete(state_key)
+        else:
+            pipe.set(state_key, state, ex=self.ttl)
+
+    def _patch_data(self, pipe, data_key: str, data: dict):
+        if data:
+            pipe.hset(data_key, mapping={k: json.dumps(v, ensure_ascii=False) for k, v in data.items()})
+        if self.ttl:
+            # Данные живут столько же, сколько состояние
+            pipe.expire(data_key, self.ttl)
+
+    async def set_state(self, key: StorageKey, state=None) -> None:
+        state_key, data_key = self._keys(key)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            self._set_state(pipe, state_key, state)
+            self._patch_data(pipe, data_key, {})
+            await pipe.execute()
+
+    async def get_state(self, key: StorageKey):
+        state_key, _ = self._keys(key)
+        return await self.redis.get(state_key)
+
+    async def set_data(self, key: StorageKey, data: dict) -> None:
+        _, data_key = self._keys(key)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(data_key)
+            self._patch_data(pipe, data_key, data)
+            await pipe.execute()
+
+    async def get_data(self, key: StorageKey) -> dict:
+        _, data_key = self._keys(key)
+        raw = await self.redis.hgetall(data_key)
+        return {k: json.loads(v) for k, v in raw.items()}
+
+    async def update_state(self, key: StorageKey, state, data: dict) -> None:
+        """Новое состояние + дописывание полей data одним MULTI/EXEC"""
+        state_key, data_key = self._keys(key)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            self._set_state(pipe, state_key, state)
+            self._patch_data(pipe, data_key, data)
+            await pipe.execute()
+
+    async def close(self) -> None:
+        await self.redis.aclose()
@@ -0,0 +1,123 @@
+"""Статические снимки рейтинга для Mini App.
+
+Бот после изменений рейтинга и проектов пересобирает в LEADERBOARD_DIR
+(обычно корень статики nginx) файлы leaderboard.json (все проекты) и
+leaderboard-<категория>.json: первые limit проектов уже отсортированы
+(score DESC, id ASC), только поля карточки, рядом лежат сжатые .gz и .br.
+Nginx отдает их сам (gzip_static / brotli_static), без Python. Формат тот
+же, что у страницы /api/projects: {"items", "next"}; next — курсор, с
+которого Mini App продолжает через API.
+
+Каждый файл строится запросом первых limit + 1 проектов, а не выгрузкой
+всей таблицы. Изменения копятся debounce секунд и публикуются одной
+пересборкой. Файлы заменяются атомарно (временный файл + os.replace), так
+что nginx никогда не отдает недописанный JSON; неизменившиеся файлы не
+перезаписываются и сохраняют свои ETag. Публикатор пишет только файлы
+leaderboard*.json* и ничего не удаляет: файл есть у каждой категории из
+списка, даже пустой.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+
+import db
+
+CARD_FIELDS = ("id", "name", "description", "category", "score")
+_UNSAFE_FILENAME = re.compile(r"[^A-Za-z0-9_-]+")
+
+
+def _compressors():
+    compressors = [(".gz", lambda body: gzip.compress(body, 9, mtime=0))]
+    try:
+        import brotli
+        compressors.append((".br", lambda body: brotli.compress(body, quality=11)))
+    except ImportError:
+        logging.info("Пакет brotli не установлен, снимки рейтинга сжимаются только gzip")
+    return compressors
+
+
+def render_page(projects, limit: int) -> bytes:
+    """Первые limit проектов в формате страницы API (projects — до limit + 1 строк)"""
+    items = [{field: project.get(field) for field in CARD_FIELDS} for project in projects[:limit]]
+    next_cursor = None
+    if len(projects) > limit:
+        last = items[-1]
+        next_cursor = f"{last['score']},{last['id']}"
+    return json.dumps({"items": items, "next": next_cursor}, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _write_atomic(path: str, body: bytes):
+    # PID в имени: воркеры бота могут публиковать одновременно
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class LeaderboardPublisher:
+    """Пересборка статических снимков рейтинга с задержкой"""
+
+    def __init__(self, directory: str, categories, limit: int = 100, debounce: float = 5):
+        self.directory = directory
+        self.categories = list(categories)
+        self.limit = limit
+        self.debounce = debounce
+        self._compressors = _compressors()
+        self._published = {}  # имя файла -> тело (что уже лежит на диске)
+        self._dirty = False
+        self._task = None
+
+    def mark_dirty(self):
+        """Рейтинг или проекты изменились: пересобрать снимки через debounce секунд"""
+        if not self.directory:
+            return
+        self._dirty = True
+        if self._task is None:
+            self._task = asyncio.create_task(self._publish_later())
+
+    async def _publish_later(self):
+        try:
+            # Изменения во время ожидания и пересборки попадут в следующую пересборку
+            while self._dirty:
+                await asyncio.sleep(self.debounce)
+                self._dirty = False
+                try:
+                    await self.publish()
+                except Exception as e:
+                    logging.error(f"Ошибка публикации рейтинга: {e}")
+        finally:
+            self._task = None
+
+    async def publish(self):
+        """Собирает снимки из базы и записывает изменившиеся файлы"""
+        columns = ",".join(CARD_FIELDS)
+        # Лишняя строка показывает, есть ли продолжение (курсор next)
+        pages = await asyncio.gather(
+            db.list_projects_page(None, None, self.limit + 1, columns),
+            *(db.list_projects_page(category, None, self.limit + 1, columns) for category in self.categories)
+        )
+        files = {"leaderboard.json": render_page(pages[0], self.limit)}
+        for category, projects in zip(self.categories, pages[1:]):
+            name = _UNSAFE_FILENAME.sub("_", str(category))
+            files[f"leaderboard-{name}.json"] = render_page(projects, self.limit)
+        return await asyncio.to_thread(self._write, files)
+
+    def _write(self, files: dict) -> int:
+        os.makedirs(self.directory, exist_ok=True)
+        written = 0
+        for name, body in files.items():
+            if self._published.get(name) == body:
+                continue
+            path = os.path.join(self.directory, name)
+            # Сначала сжатые версии: новый .json не должен соседствовать со старым .gz дольше нужного
+            for suffix, compress in self._compressors:
+                _write_atomic(path + suffix, compress(body))
+            _write_atomic(path, body)
+            self._published[name] = body
+            written += 1
+        return written
@@ -0,0 +1,276 @@
+"""Фоновая отправка логов в админ-группу.
+
+Хендлеры только ставят лог в очередь и сразу возвращаются. Воркеры
+отправляют сообщения параллельно, но не чаще лимита группы (token bucket).
+В режиме сводки обычные события копятся по топикам и уходят одним
+сообщением; срочные (баны, удаления) отправляются сразу.
+Каждое сообщение сначала записывается в локальный SQLite-outbox и
+удаляется оттуда только после успешной отправки, поэтому неотправленные
+логи переживают перезапуск бота.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+
+class TokenBucket:
+    """Ограничитель частоты: rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Ждет, пока можно будет отправить одно сообщение"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def block(self, seconds: float):
+        """Пауза для всех отправок (Telegram вернул retry_after)"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class LogOutbox:
+    """Неотправленные логи в SQLite
+
+    Методы вызываются из разных потоков (asyncio.to_thread), а соединение
+    одно, поэтому каждый вызов целиком идет под блокировкой.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS log_outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " chat_id INTEGER NOT NULL,"
+            " thread_id INTEGER,"
+            " text TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def add(self, chat_id: int, thread_id, text: str) -> int:
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO log_outbox (chat_id, thread_id, text, created_at) VALUES (?, ?, ?, ?)",
+                (chat_id, thread_id, text, time.time())
+            )
+            self._conn.commit()
+            return cur.lastrowid
+
+    def delete(self, entry_ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM log_outbox WHERE id = ?", [(i,) for i in entry_ids])
+            self._conn.commit()
+
+    def bump_attempts(self, entry_ids):
+        with self._lock:
+            self._conn.executemany("UPDATE log_outbox SET attempts = attempts + 1 WHERE id = ?",
+                                   [(i,) for i in entry_ids])
+            self._conn.commit()
+
+    def pending(self):
+        """Все неотправленные логи в порядке постановки"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, chat_id, thread_id, text, attempts FROM log_outbox ORDER BY id"
+            ).fetchall()
+        return [
+            {"ids": [r[0]], "chat_id": r[1], "thread_id": r[2], "text": r[3], "attempts": r[4]}
+            for r in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+MESSAGE_LIMIT = 4096
+DIGEST_SEPARATOR = "\n⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯\n"
+
+
+def render_digest(texts) -> str:
+    """Одно сообщение из нескольких логов (один лог отправляется как есть)"""
+    if len(texts) == 1:
+        return texts[0]
+    return f"🗂 <b>Сводка логов</b> ({len(texts)})" + DIGEST_SEPARATOR + DIGEST_SEPARATOR.join(texts)
+
+
+def group_digests(texts, limit: int = MESSAGE_LIMIT):
+    """Делит логи на группы, каждая из которых помещается в одно сообщение.
+    
+    Граница проходит только между событиями, поэтому HTML-теги и команды
+    вроде <code>/delrev 123</code> остаются целыми.
+    """
+    groups = []
+    group = []
+    for text in texts:
+        if group and len(render_digest(group + [text])) > limit:
+            groups.append(group)
+            group = []
+        group.append(text)
+    if group:
+        groups.append(group)
+    return groups
+
+
+class LogDispatcher:
+    """Очередь логов + воркеры отправки с ограничением частоты
+    
+    digest_window > 0 включает режим сводки: события копятся по (чат, топик)
+    до digest_window секунд или digest_max_events штук.
+    """
+
+    def __init__(self, bot, outbox_path: str, per_minute: int = 20, burst: int = 3,
+                 workers: int = 2, max_attempts: int = 5,
+                 digest_window: float = 0, digest_max_events: int = 10):
+        self.bot = bot
+        self.outbox = LogOutbox(outbox_path)
+        self.bucket = TokenBucket(rate=per_minute / 60, capacity=burst)
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.digest_window = digest_window
+        self.digest_max_events = digest_max_events
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        self._digests = {}  # (chat_id, thread_id) -> [(outbox_id, text)]
+        self._digest_timers = {}
+
+    async def start(self):
+        """Повторно ставит в очередь логи, оставшиеся с прошлого запуска, и запускает воркеры"""
+        pending = await asyncio.to_thread(self.outbox.pending)
+        for entry in pending:
+            self._queue.put_nowait(entry)
+        if pending:
+            logging.info(f"Из outbox восстановлено логов: {len(pending)}")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Останавливает воркеры; неотправленное (в т.ч. из сводок) остается в outbox"""
+        for task in [*self._tasks, *self._digest_timers.values()]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._digest_timers.values(), return_exceptions=True)
+        self._tasks = []
+        self._digest_timers = {}
+        self._digests = {}
+        self.outbox.close()
+
+    async def enqueue(self, chat_id: int, text: str, thread_id: int = None, priority: bool = False):
+        """Сохраняет лог в outbox и ставит на отправку (срочные — минуя сводку)"""
+        entry_id = await asyncio.to_thread(self.outbox.add, chat_id, thread_id, text)
+        if priority or self.digest_window <= 0:
+            self._queue.put_nowait(
+                {"ids": [entry_id], "chat_id": chat_id, "thread_id": thread_id, "text": text, "attempts": 0}
+            )
+            return
+
+        key = (chat_id, thread_id)
+        self._digests.setdefault(key, []).append((entry_id, text))
+        if len(self._digests[key]) >= self.digest_max_events:
+            timer = self._digest_timers.pop(key, None)
+            if timer:
+                timer.cancel()
+            self._flush_digest(key)
+        elif key not in self._digest_timers:
+            self._digest_timers[key] = asyncio.create_task(self._flush_later(key))
+
+    async def _flush_later(self, key):
+        await asyncio.sleep(self.digest_window)
+        self._digest_timers.pop(key, None)
+        self._flush_digest(key)
+
+    def _flush_digest(self, key):
+        """Превращает накопленные события топика в одно или несколько сообщений"""
+        events = self._digests.pop(key, [])
+        if not events:
+            return
+        chat_id, thread_id = key
+        start = 0
+        for group in group_digests([text for _, text in events]):
+            # ID событий сводки — чтобы удалить их из outbox после отправки
+            ids = [entry_id for entry_id, _ in events[start:start + len(group)]]
+            start += len(group)
+            # texts — исходные события, чтобы при ошибке отправить их по одному
+            self._queue.put_nowait(
+                {"ids": ids, "chat_id": chat_id, "thread_id": thread_id, "text": render_digest(group),
+                 "texts": group, "attempts": 0}
+            )
+
+    async def _worker(self):
+        while True:
+            entry = await self._queue.get()
+            try:
+                await self._deliver(entry)
+            except Exception as e:
+                logging.error(f"Ошибка отправки лога #{entry['ids']}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, entry: dict):
+        while True:
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(
+                    entry['chat_id'],
+                    entry['text'],
+                    message_thread_id=entry['thread_id'],
+                    parse_mode="HTML"
+                )
+            except TelegramRetryAfter as e:
+                # Группа упёрлась в лимит: ждем и пробуем снова, не тратя попытку
+                logging.warning(f"Лимит отправки логов, пауза {e.retry_after} с")
+                self.bucket.block(e.retry_after)
+                continue
+            except (TelegramBadRequest, TelegramForbiddenError) as e:
+                if isinstance(e, TelegramBadRequest) and len(entry['ids']) > 1:
+                    # Ошибку могло вызвать одно событие сводки: шлем каждое отдельно,
+                    # отброшено будет только само сломанное
+                    logging.warning(f"Сводка #{entry['ids']} не отправлена, события уйдут по одному: {e}")
+                    for entry_id, text in zip(entry['ids'], entry['texts']):
+                        self._queue.put_nowait(
+                            {"ids": [entry_id], "chat_id": entry['chat_id'], "thread_id": entry['thread_id'],
+                             "text": text, "attempts": 0}
+                        )
+                    return
+                # Повтор не поможет (нет топика, бот исключен и т.п.)
+                logging.error(f"Лог #{entry['ids']} отброшен: {e}")
+                await asyncio.to_thread(self.outbox.delete, entry['ids'])
+                return
+            except Exception as e:
+                entry['attempts'] += 1
+                await asyncio.to_thread(self.outbox.bump_attempts, entry['ids'])
+                if entry['attempts'] >= self.max_attempts:
+                    logging.error(f"Лог #{entry['ids']} не отправлен после {entry['attempts']} попыток, "
+                                  f"остается в outbox до перезапуска: {e}")
+                    return
+                await asyncio.sleep(2 ** entry['attempts'])
+                continue
+
+            await asyncio.to_thread(self.outbox.delete, entry['ids'])
+            logging.info(f"Лог отправлен в топик {entry['thread_id'] or 'основного чата'}")
+            return
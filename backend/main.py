@@ -1,19 +1,34 @@
 import asyncio
+import hmac
 import os
 import logging
+import signal
+from aiohttp import web
 from aiogram import Bot, Dispatcher, Router, F, BaseMiddleware
 from aiogram.filters import Command, CommandStart
 from aiogram.types import (
     Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton,
-    ReplyKeyboardMarkup, KeyboardButton, FSInputFile
+    ReplyKeyboardMarkup, KeyboardButton, FSInputFile, ChatMemberUpdated,
+    InputMediaPhoto
 )
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
-from supabase import create_client, Client
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
 from html import escape  # Добавлен для экранирования HTML
+import db
+from roles import RoleCache, ADMIN_STATUSES
+from bans import BanIndex
+from photos import PhotoCache
+from apicalls import ApiCallCounter
+from weekly_top import WeeklyTop
+from log_dispatcher import LogDispatcher
+from fsm_storage import SQLiteFSMStorage, RedisFSMStorage, advance_state
+from workers import WorkerPool, broadcast_control, consume_updates, poll_updates
+from search_index import SearchIndex
+from reports import Report, ReportCache, report_kb, parse_callback, CALLBACK_PREFIX
+from leaderboard import LeaderboardPublisher
 
 # --- НАСТРОЙКИ ТОПИКОВ (Замени цифры на ID из ссылок) ---
 TOPIC_LOGS_ALL = 46  # Общий топик для ВСЕХ логов/отзывов
@@ -32,12 +47,80 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 ADMIN_GROUP_ID = int(os.getenv("ADMIN_CHAT_ID", 0))
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", 300))  # Сколько секунд помним роль пользователя
+BAN_REFRESH_INTERVAL = int(os.getenv("BAN_REFRESH_INTERVAL", 60))  # Период сверки бан-листа с базой
+LOG_OUTBOX_PATH = os.getenv("LOG_OUTBOX_PATH", "log_outbox.sqlite3")  # Неотправленные логи
+LOG_RATE_PER_MINUTE = int(os.getenv("LOG_RATE_PER_MINUTE", 20))  # Лимит сообщений в группу
+LOG_DIGEST_WINDOW = float(os.getenv("LOG_DIGEST_WINDOW", 0))  # Окно сводки логов в секундах (0 — выкл.)
+LOG_DIGEST_MAX_EVENTS = int(os.getenv("LOG_DIGEST_MAX_EVENTS", 10))  # Событий в сводке до досрочной отправки
+
+# --- РЕЖИМ ПОЛУЧЕНИЯ АПДЕЙТОВ ---
+# "polling" — long polling (по умолчанию)
+# "webhook" — Telegram сам присылает апдейты на WEBHOOK_URL + WEBHOOK_PATH
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+DROP_PENDING_UPDATES = os.getenv("DROP_PENDING_UPDATES", "0") == "1"  # Выбрасывать накопленные апдейты при старте
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Публичный https-адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Сверяется с X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40))  # Сколько апдейтов Telegram шлет параллельно
+# WORKERS > 1 — один процесс-приемник и WORKERS процессов с хендлерами (см. workers.py)
+WORKERS = int(os.getenv("WORKERS", 1))
+WORKER_SYNC_INTERVAL = int(os.getenv("WORKER_SYNC_INTERVAL", 60))  # Период сверки кэшей воркера с базой
+SEARCH_INDEX_REFRESH_INTERVAL = int(os.getenv("SEARCH_INDEX_REFRESH_INTERVAL", 300))  # Пересборка поиска в одном процессе
+
+# --- УДАЛЕНИЕ ПРОЕКТОВ (см. migrations/006) ---
+DELETE_INLINE_LIMIT = int(os.getenv("DELETE_INLINE_LIMIT", 1000))  # Больше отзывов и истории — удаляются в фоне
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", 1000))  # Строк за один шаг фоновой очистки
+PURGE_INTERVAL = int(os.getenv("PURGE_INTERVAL", 60))  # Период проверки удаленных проектов
+
+# --- СТАТИЧЕСКИЙ РЕЙТИНГ ДЛЯ MINI APP (см. leaderboard.py) ---
+LEADERBOARD_DIR = os.getenv("LEADERBOARD_DIR", "")  # Например /var/www/tma (пусто — выкл.)
+LEADERBOARD_LIMIT = int(os.getenv("LEADERBOARD_LIMIT", 100))  # Проектов в файле, дальше — через API
+LEADERBOARD_DEBOUNCE = float(os.getenv("LEADERBOARD_DEBOUNCE", 5))  # Сколько секунд копить изменения
+
+# --- ХРАНИЛИЩЕ FSM (черновики отзывов и админских действий) ---
+# "memory" — в памяти процесса, теряется при перезапуске
+# "sqlite" — файл FSM_SQLITE_PATH, для одного инстанса
+# "redis"  — REDIS_URL, общее для нескольких воркеров
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+FSM_SQLITE_PATH = os.getenv("FSM_SQLITE_PATH", "fsm.sqlite3")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+FSM_TTL = int(os.getenv("FSM_TTL", 86400))  # Через сколько секунд брошенный черновик удаляется
+
+# --- РЕЖИМ ВЫДАЧИ ПРОЕКТОВ В КАТЕГОРИЯХ ---
+# "cards"   — отдельная карточка на каждый проект (по умолчанию)
+# "album"   — фото проектов одной медиагруппой + одно сообщение с кнопками
+# "compact" — одно текстовое сообщение со списком и кнопками панелей
+LISTING_MODE_DEFAULT = os.getenv("LISTING_MODE", "cards")
+LISTING_MODES = {
+    # "kmbp_channels": "compact",
+}
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+api_calls = ApiCallCounter()
+bot.session.middleware(api_calls)
+if FSM_STORAGE == "redis":
+    storage = RedisFSMStorage.from_url(REDIS_URL, ttl=FSM_TTL)
+elif FSM_STORAGE == "sqlite":
+    storage = SQLiteFSMStorage(FSM_SQLITE_PATH, ttl=FSM_TTL)
+else:
+    storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 router = Router()
+role_cache = RoleCache(ttl=ADMIN_CACHE_TTL)
+ban_index = BanIndex()
+photo_cache = PhotoCache()
+weekly_top_engine = WeeklyTop(days=7)
+search_index = SearchIndex()
+report_cache = ReportCache()
+log_dispatcher = LogDispatcher(
+    bot, LOG_OUTBOX_PATH,
+    per_minute=LOG_RATE_PER_MINUTE,
+    digest_window=LOG_DIGEST_WINDOW,
+    digest_max_events=LOG_DIGEST_MAX_EVENTS
+)
 
 CATEGORIES = {
     "support_bots": "Боты поддержки",
@@ -47,7 +130,7 @@ CATEGORIES = {
     "kmbp_channels": "Каналы КМБП"
 }
 
-RATING_MAP = {1: -5, 2: -2, 3: 0, 4: 2, 5: 5}
+leaderboard = LeaderboardPublisher(LEADERBOARD_DIR, CATEGORIES, LEADERBOARD_LIMIT, LEADERBOARD_DEBOUNCE)
 
 class ReviewState(StatesGroup):
     waiting_for_text = State()
@@ -65,9 +148,15 @@ class SearchState(StatesGroup):
 
 # --- ПРОВЕРКА ПРАВ (ПО ЧАТУ) ---
 async def is_user_admin(user_id: int) -> bool:
+    """Проверка прав через кэш, get_chat_member только при промахе"""
+    cached = role_cache.get(user_id)
+    if cached is not None:
+        return cached
     try:
         member = await bot.get_chat_member(chat_id=ADMIN_GROUP_ID, user_id=user_id)
-        return member.status in ["creator", "administrator", "member"]
+        is_admin = member.status in ADMIN_STATUSES
+        role_cache.set(user_id, is_admin)
+        return is_admin
     except Exception as e:
         logging.error(f"Ошибка проверки админки: {e}")
         return False
@@ -79,43 +168,46 @@ class AccessMiddleware(BaseMiddleware):
         
         # Проверяем, что это сообщение от пользователя (не от бота)
         if not user or user.is_bot: 
+            data["is_admin"] = False
             return await handler(event, data)
         
-        # Проверяем, является ли пользователь админом
-        if await is_user_admin(user.id): 
+        # Проверяем, является ли пользователь админом (результат получают хендлеры)
+        data["is_admin"] = await is_user_admin(user.id)
+        if data["is_admin"]: 
             return await handler(event, data)
         
-        # Проверяем, забанен ли пользователь
-        try:
-            res = supabase.table("banned_users")\
-                .select("user_id, reason")\
-                .eq("user_id", user.id)\
-                .execute()
-            
-            # Если пользователь найден в таблице banned_users
-            if res.data:
-                # Показываем сообщение о бане, если это Message
-                if isinstance(event, Message):
-                    await event.answer(
-                        f"🚫 Вы заблокированы!\n"
-                        f"📝 Причина: {res.data[0].get('reason', 'Не указана')}\n\n"
-                        f"Для разблокировки обратитесь к администратору.",
-                        parse_mode="HTML"
-                    )
-                # Или просто отвечаем на CallbackQuery
-                elif isinstance(event, CallbackQuery):
-                    await event.answer(
-                        "🚫 Вы заблокированы!",
-                        show_alert=True
-                    )
-                return  # Блокируем выполнение handler
-        
-        except Exception as e:
-            logging.error(f"Ошибка проверки бана: {e}")
+        # Проверяем, забанен ли пользователь (по индексу в памяти)
+        ban = ban_index.get(user.id)
+        
+        # Если пользователь найден в таблице banned_users
+        if ban:
+            # Показываем сообщение о бане, если это Message
+            if isinstance(event, Message):
+                await event.answer(
+                    f"🚫 Вы заблокированы!\n"
+                    f"📝 Причина: {ban.get('reason', 'Не указана')}\n\n"
+                    f"Для разблокировки обратитесь к администратору.",
+                    parse_mode="HTML"
+                )
+            # Или просто отвечаем на CallbackQuery
+            elif isinstance(event, CallbackQuery):
+                await event.answer(
+                    "🚫 Вы заблокированы!",
+                    show_alert=True
+                )
+            return  # Блокируем выполнение handler
         
         # Если пользователь не забанен, пропускаем
         return await handler(event, data)
 
+# --- ОБНОВЛЕНИЕ КЭША РОЛЕЙ ---
+@router.chat_member(F.chat.id == ADMIN_GROUP_ID)
+async def admin_group_member_changed(event: ChatMemberUpdated):
+    """Обновляет кэш ролей при входе, выходе или смене статуса в админ-группе"""
+    member = event.new_chat_member
+    role_cache.set_status(member.user.id, member.status)
+    logging.info(f"Роль пользователя {member.user.id} обновлена: {member.status}")
+
 # --- КЛАВИАТУРЫ ---
 def main_kb():
     """Основная клавиатура с категориями и поиском"""
@@ -183,47 +275,41 @@ def rating_kb():
     buttons.append([InlineKeyboardButton(text="⬅️ Назад к тексту", callback_data="back_to_text")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def pagination_kb(category_key, offset, has_next=True):
-    """Клавиатура пагинации для кнопки 'Показать еще'"""
+def pagination_kb(category_key, last_project, shown, has_next=True):
+    """Клавиатура пагинации для кнопки 'Показать еще'
+    
+    В callback_data лежит курсор (score, id) последнего показанного проекта
+    и количество уже показанных проектов.
+    """
     buttons = []
     if has_next:
-        callback_data = f"more_{category_key}_{offset}"
+        callback_data = f"more_{category_key}_{last_project['score']}_{last_project['id']}_{shown}"
         buttons.append([InlineKeyboardButton(text="📜 Показать еще", callback_data=callback_data)])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 # --- ФУНКЦИЯ ОТПРАВКИ ЛОГОВ ---
-async def send_log_to_topics(admin_text: str, category: str = None):
-    """Отправляет лог во все нужные топики"""
+async def send_log_to_topics(admin_text: str, category: str = None, priority: bool = False):
+    """Ставит лог в очередь на отправку во все нужные топики (не ждет Telegram).
+    
+    priority=True — лог уходит сразу, не дожидаясь сводки (баны, удаления).
+    """
     try:
-        # 1. Шлем в общий топик логов
+        # 1. Общий топик логов
         if TOPIC_LOGS_ALL:
-            await bot.send_message(
-                ADMIN_GROUP_ID, 
-                admin_text, 
-                message_thread_id=TOPIC_LOGS_ALL, 
-                parse_mode="HTML"
-            )
-            logging.info(f"Лог отправлен в общий топик {TOPIC_LOGS_ALL}")
+            await log_dispatcher.enqueue(ADMIN_GROUP_ID, admin_text, thread_id=TOPIC_LOGS_ALL, priority=priority)
         
-        # 2. Шлем в топик конкретной категории
+        # 2. Топик конкретной категории
         if category:
             cat_topic = TOPICS_BY_CATEGORY.get(category)
             if cat_topic:
-                await bot.send_message(
-                    ADMIN_GROUP_ID, 
-                    admin_text, 
-                    message_thread_id=cat_topic, 
-                    parse_mode="HTML"
-                )
-                logging.info(f"Лог отправлен в топик категории {category}: {cat_topic}")
+                await log_dispatcher.enqueue(ADMIN_GROUP_ID, admin_text, thread_id=cat_topic, priority=priority)
         
         # 3. Если общий топик не указан, отправляем в основной чат
         elif not TOPIC_LOGS_ALL and ADMIN_GROUP_ID:
-            await bot.send_message(ADMIN_GROUP_ID, admin_text, parse_mode="HTML")
-            logging.info("Лог отправлен в основной админ-чат")
+            await log_dispatcher.enqueue(ADMIN_GROUP_ID, admin_text, priority=priority)
             
     except Exception as e:
-        logging.error(f"Ошибка отправки лога: {e}")
+        logging.error(f"Ошибка постановки лога в очередь: {e}")
 
 # --- ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ---
 async def safe_edit_message(call: CallbackQuery, text: str, reply_markup=None, parse_mode="HTML"):
@@ -260,10 +346,7 @@ async def safe_edit_media(call: CallbackQuery, caption: str, reply_markup=None,
 async def get_project_photo(project_id: int):
     """Получает фото проекта из базы"""
     try:
-        result = supabase.table("project_photos").select("*").eq("project_id", project_id).execute()
-        if result.data:
-            # Возвращаем file_id фото
-            return result.data[0].get('photo_file_id', '')
+        return await photo_cache.get(project_id)
     except Exception as e:
         logging.error(f"Ошибка получения фото: {e}")
     return None
@@ -271,23 +354,33 @@ async def get_project_photo(project_id: int):
 async def save_project_photo(project_id: int, photo_file_id: str, admin_id: int):
     """Сохраняет фото проекта в базу"""
     try:
-        supabase.table("project_photos").upsert({
+        await db.upsert_project_photo({
             "project_id": project_id,
             "photo_file_id": photo_file_id,
             "updated_by": admin_id,
             "updated_at": "now()"
-        }).execute()
+        })
+        photo_cache.set(project_id, photo_file_id)
         return True
     except Exception as e:
         logging.error(f"Ошибка сохранения фото: {e}")
         return False
 
 async def find_project_by_name(name: str):
-    """Находит проект по названию"""
+    """Находит проект по названию: точное совпадение, иначе лучший из содержащих строку"""
     try:
-        result = supabase.table("projects").select("*").ilike("name", f"%{name}%").execute()
-        if result.data:
-            return result.data[0]  # Возвращаем первый найденный проект
+        match = search_index.find(name) if search_index.loaded else None
+        if match:
+            # Свежая строка из базы: рейтинг в индексе мог измениться в другом воркере
+            project = await db.get_project(match['id'])
+            if project:
+                return project
+            search_index.remove(match['id'])  # Удален в другом воркере
+        # Индекс мог еще не знать проект (добавлен в другом воркере или напрямую в базу)
+        project = await db.get_project_by_exact_name(name) or await db.find_project_by_name(name)
+        if project and search_index.loaded:
+            search_index.add(project)
+        return project
     except Exception as e:
         logging.error(f"Ошибка поиска проекта: {e}")
     return None
@@ -295,9 +388,7 @@ async def find_project_by_name(name: str):
 async def find_project_by_id(project_id: int):
     """Находит проект по ID"""
     try:
-        result = supabase.table("projects").select("*").eq("id", project_id).execute()
-        if result.data:
-            return result.data[0]
+        return await db.get_project(project_id)
     except Exception as e:
         logging.error(f"Ошибка поиска проекта по ID: {e}")
     return None
@@ -305,49 +396,26 @@ async def find_project_by_id(project_id: int):
 async def get_weekly_top():
     """Получает топ проектов за неделю (по изменению рейтинга за 7 дней)"""
     try:
-        week_ago = (datetime.now() - timedelta(days=7)).isoformat()
-        
-        # Получаем проекты с наибольшим изменением рейтинга за неделю
-        result = supabase.table("rating_history")\
-            .select("project_id, SUM(change_amount) as total_change")\
-            .gte("created_at", week_ago)\
-            .group("project_id")\
-            .order("total_change", desc=True)\
-            .limit(10)\
-            .execute()
-        
-        top_projects = []
-        for item in result.data:
-            project = await find_project_by_id(item['project_id'])
-            if project:
-                project['weekly_change'] = item['total_change']
-                top_projects.append(project)
-        
-        return top_projects
-        
+        # Суммы изменений хранятся в памяти по дням, данные проектов — в кэше
+        return await weekly_top_engine.top(10)
     except Exception as e:
         logging.error(f"Ошибка получения топа недели: {e}")
         return []
 
-async def show_projects_batch(category_key, offset, message_or_call, is_first_batch=False):
-    """Показывает партию проектов (по 5 штук)"""
+async def show_projects_batch(category_key, cursor, shown, message_or_call, is_first_batch=False):
+    """Показывает партию проектов (по 5 штук) после курсора (score, id)"""
+    mode = LISTING_MODES.get(category_key, LISTING_MODE_DEFAULT)
+    with api_calls.measure() as calls:
+        await _show_projects_batch(category_key, cursor, shown, message_or_call, is_first_batch, mode)
+    logging.info(f"Страница {category_key} ({mode}): {sum(calls.values())} вызовов Bot API {dict(calls)}")
+
+async def _show_projects_batch(category_key, cursor, shown, message_or_call, is_first_batch, mode):
     projects_per_batch = 5
     
-    # Получаем проекты для категории
-    data = supabase.table("projects")\
-        .select("*")\
-        .eq("category", category_key)\
-        .order("score", desc=True)\
-        .range(offset, offset + projects_per_batch - 1)\
-        .execute().data
-    
-    # Считаем общее количество проектов
-    count_result = supabase.table("projects")\
-        .select("*", count="exact")\
-        .eq("category", category_key)\
-        .execute()
-    
-    total_projects = count_result.count if hasattr(count_result, 'count') else 0
+    # Получаем проекты для категории; count приходит в том же запросе
+    # и равен числу проектов начиная с курсора
+    data, remaining = await db.list_category_page(category_key, cursor, projects_per_batch)
+    total_projects = shown + remaining
     
     if not data: 
         if is_first_batch:
@@ -363,6 +431,18 @@ async def show_projects_batch(category_key, offset, message_or_call, is_first_ba
                 await message_or_call.answer("Больше проектов нет", show_alert=True)
         return
     
+    # Фото всех проектов страницы одним запросом (или из кэша)
+    try:
+        photos = await photo_cache.get_many([p['id'] for p in data])
+    except Exception as e:
+        logging.error(f"Ошибка получения фото: {e}")
+        photos = {}
+    
+    if mode in ("album", "compact"):
+        await send_projects_page_grouped(category_key, data, photos, shown, total_projects,
+                                         message_or_call, is_first_batch, mode)
+        return
+    
     # Если это первый батч, отправляем новое сообщение
     if is_first_batch:
         category_name = CATEGORIES[category_key]
@@ -375,8 +455,7 @@ async def show_projects_batch(category_key, offset, message_or_call, is_first_ba
             await message_or_call.answer(text, parse_mode="HTML")
     
     for p in data:
-        # Получаем фото проекта
-        photo_file_id = await get_project_photo(p['id'])
+        photo_file_id = photos.get(p['id'])
         
         # Экранируем данные
         project_name_escaped = escape(str(p['name']))
@@ -417,39 +496,113 @@ async def show_projects_batch(category_key, offset, message_or_call, is_first_ba
                 await message_or_call.answer(card, reply_markup=project_card_kb(p['id']), parse_mode="HTML")
     
     # Проверяем, есть ли еще проекты
-    has_next = offset + projects_per_batch < total_projects
+    new_shown = shown + len(data)
+    has_next = new_shown < total_projects
     
     # Если это первый батч и есть еще проекты, добавляем кнопку "Показать еще"
     if is_first_batch and has_next:
-        kb = pagination_kb(category_key, offset + projects_per_batch, has_next)
+        kb = pagination_kb(category_key, data[-1], new_shown, has_next)
         if isinstance(message_or_call, CallbackQuery):
             await message_or_call.message.answer("⬇️ <b>Показано:</b> <code>{}-{}</code> из <code>{}</code> проектов".format(
-                offset + 1, min(offset + projects_per_batch, total_projects), total_projects
+                shown + 1, new_shown, total_projects
             ), reply_markup=kb, parse_mode="HTML")
         else:
             await message_or_call.answer("⬇️ <b>Показано:</b> <code>{}-{}</code> из <code>{}</code> проектов".format(
-                offset + 1, min(offset + projects_per_batch, total_projects), total_projects
+                shown + 1, new_shown, total_projects
             ), reply_markup=kb, parse_mode="HTML")
     elif isinstance(message_or_call, CallbackQuery) and not is_first_batch:
-        # Обновляем сообщение с пагинацией
-        new_offset = offset + projects_per_batch
-        new_has_next = new_offset < total_projects
-        
         # Удаляем старое сообщение с пагинацией и создаем новое
         try:
             await message_or_call.message.delete()
         except:
             pass
             
-        if new_has_next:
-            kb = pagination_kb(category_key, new_offset, new_has_next)
+        if has_next:
+            kb = pagination_kb(category_key, data[-1], new_shown, has_next)
             await message_or_call.message.answer("⬇️ <b>Показано:</b> <code>{}-{}</code> из <code>{}</code> проектов".format(
-                offset + projects_per_batch + 1, min(new_offset + projects_per_batch, total_projects), total_projects
+                shown + 1, new_shown, total_projects
             ), reply_markup=kb, parse_mode="HTML")
         else:
             # Если проектов больше нет, отправляем финальное сообщение
             await message_or_call.message.answer("✅ <b>Показаны все проекты</b>\nВсего проектов: <code>{}</code>".format(total_projects), parse_mode="HTML")
 
+async def send_projects_page_grouped(category_key, data, photos, shown, total_projects,
+                                     message_or_call, is_first_batch, mode):
+    """Страница проектов одним сообщением (compact) или медиагруппой + сообщением (album)
+    
+    compact: 1 вызов Bot API на страницу (следующие страницы редактируют сообщение).
+    album: медиагруппа с фото + сообщение со списком и кнопками панелей.
+    """
+    target = message_or_call.message if isinstance(message_or_call, CallbackQuery) else message_or_call
+    new_shown = shown + len(data)
+    has_next = new_shown < total_projects
+    
+    # Фото отправляем медиагруппой (в album), остальные проекты идут текстом
+    in_album = []
+    if mode == "album":
+        in_album = [p for p in data if photos.get(p['id'])]
+        if in_album:
+            media = []
+            for p in in_album:
+                project_name_escaped = escape(str(p['name']))
+                description_escaped = escape(str(p['description']))
+                caption = f"<b>{project_name_escaped}</b>\n\n{description_escaped[:150]}{'...' if len(p['description']) > 150 else ''}\n"
+                caption += f"📊 Текущий рейтинг: <b>{p['score']}</b>"
+                media.append(InputMediaPhoto(media=photos[p['id']], caption=caption, parse_mode="HTML"))
+            try:
+                if len(media) == 1:
+                    # Медиагруппа требует минимум 2 элемента
+                    await target.answer_photo(photo=media[0].media, caption=media[0].caption, parse_mode="HTML")
+                else:
+                    await target.answer_media_group(media)
+            except Exception as e:
+                logging.error(f"Ошибка отправки медиагруппы: {e}")
+                in_album = []
+    
+    album_ids = {p['id'] for p in in_album}
+    text = ""
+    if is_first_batch:
+        category_name = CATEGORIES[category_key]
+        text += f"<b>{escape(category_name)}</b>\n"
+        text += f"Всего проектов: {total_projects}\n⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯\n\n"
+    
+    for i, p in enumerate(data, start=shown + 1):
+        project_name_escaped = escape(str(p['name']))
+        text += f"<b>{i}. {project_name_escaped}</b> — 📊 <b>{p['score']}</b>\n"
+        if p['id'] not in album_ids:
+            description_escaped = escape(str(p['description']))
+            text += f"{description_escaped[:100]}{'...' if len(p['description']) > 100 else ''}\n"
+        text += f"⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯\n"
+    
+    if has_next:
+        text += f"\n⬇️ <b>Показано:</b> <code>{shown + 1}-{new_shown}</code> из <code>{total_projects}</code> проектов"
+    else:
+        text += f"\n✅ <b>Показаны все проекты</b>\nВсего проектов: <code>{total_projects}</code>"
+    
+    keyboard = [
+        [InlineKeyboardButton(text=f"🔘 {p['name']} ({p['score']})", callback_data=f"panel_{p['id']}")]
+        for p in data
+    ]
+    if has_next:
+        keyboard += pagination_kb(category_key, data[-1], new_shown).inline_keyboard
+    kb = InlineKeyboardMarkup(inline_keyboard=keyboard)
+    
+    if is_first_batch or not isinstance(message_or_call, CallbackQuery):
+        await target.answer(text, reply_markup=kb, parse_mode="HTML")
+    elif mode == "compact":
+        # Листаем на месте: то же сообщение показывает следующую страницу
+        await safe_edit_message(message_or_call, text, reply_markup=kb)
+    else:
+        # Убираем кнопку "Показать еще" у предыдущей страницы, кнопки панелей оставляем
+        try:
+            old_keyboard = target.reply_markup.inline_keyboard if target.reply_markup else []
+            await target.edit_reply_markup(reply_markup=InlineKeyboardMarkup(
+                inline_keyboard=[row for row in old_keyboard if not row[0].callback_data.startswith("more_")]
+            ))
+        except Exception as e:
+            logging.error(f"Ошибка обновления кнопок: {e}")
+        await target.answer(text, reply_markup=kb, parse_mode="HTML")
+
 # --- ОБРАБОТЧИК ПАГИНАЦИИ ---
 @router.callback_query(F.data.startswith("more_"))
 async def handle_show_more(call: CallbackQuery):
@@ -458,13 +611,13 @@ async def handle_show_more(call: CallbackQuery):
         callback_data = call.data
         parts = callback_data.split("_")
         
-        if len(parts) >= 3:
-            category_key = "_".join(parts[1:-1])
-            offset_str = parts[-1]
+        # more_{категория}_{score}_{id}_{показано}
+        if len(parts) >= 5:
+            category_key = "_".join(parts[1:-3])
             
             try:
-                offset = int(offset_str)
-                await show_projects_batch(category_key, offset, call, is_first_batch=False)
+                score, last_id, shown = (int(x) for x in parts[-3:])
+                await show_projects_batch(category_key, (score, last_id), shown, call, is_first_batch=False)
                 await call.answer()
             except ValueError:
                 await call.answer("❌ Ошибка: неверный формат данных", show_alert=True)
@@ -559,13 +712,11 @@ async def search_project_execute(message: Message, state: FSMContext):
         return
     
     try:
-        # Ищем проекты по названию
-        results = supabase.table("projects")\
-            .select("*")\
-            .ilike("name", f"%{search_query}%")\
-            .order("score", desc=True)\
-            .limit(10)\
-            .execute().data
+        # Ищем проекты по индексу в памяти (название с опечатками, описание)
+        if search_index.loaded:
+            results = search_index.search(search_query, limit=10)
+        else:
+            results = await db.search_projects(search_query, limit=10)
         
         if not results:
             search_query_escaped = escape(search_query)
@@ -618,8 +769,8 @@ async def search_project_execute(message: Message, state: FSMContext):
 # --- АДМИН-КОМАНДЫ ---
 
 @router.message(Command("add"))
-async def admin_add(message: Message, state: FSMContext):
-    if not await is_user_admin(message.from_user.id): 
+async def admin_add(message: Message, state: FSMContext, is_admin: bool = False):
+    if not is_admin: 
         return
         
     await state.clear()
@@ -657,8 +808,8 @@ async def admin_add(message: Message, state: FSMContext):
             )
             return
         
-        existing = supabase.table("projects").select("*").eq("name", name).execute()
-        if existing.data:
+        existing = await db.get_project_by_exact_name(name)
+        if existing:
             name_escaped = escape(name)
             await message.reply(
                 f"⚠️ Проект <b>{name_escaped}</b> уже существует!",
@@ -666,17 +817,20 @@ async def admin_add(message: Message, state: FSMContext):
             )
             return
         
-        result = supabase.table("projects").insert({
+        created = await db.insert_project({
             "name": name, 
             "category": cat, 
             "description": desc,
             "score": 0
-        }).execute()
+        })
         
-        if result.data:
+        if created:
+            search_index.add(created)
+            leaderboard.mark_dirty()
+            
             # Добавляем запись в историю
-            supabase.table("rating_history").insert({
-                "project_id": result.data[0]['id'],
+            await db.insert_history({
+                "project_id": created['id'],
                 "admin_id": message.from_user.id,
                 "admin_username": message.from_user.username,
                 "change_type": "create",
@@ -685,7 +839,7 @@ async def admin_add(message: Message, state: FSMContext):
                 "change_amount": 0,
                 "reason": "Создание проекта",
                 "is_admin_action": True
-            }).execute()
+            })
             
             # Отправляем лог
             name_escaped = escape(name)
@@ -700,7 +854,7 @@ async def admin_add(message: Message, state: FSMContext):
             
             await message.reply(
                 f"✅ Проект <b>{name_escaped}</b> успешно добавлен!\n"
-                f"🆔 ID проекта: <code>{result.data[0]['id']}</code>",
+                f"🆔 ID проекта: <code>{created['id']}</code>",
                 parse_mode="HTML"
             )
         else:
@@ -715,8 +869,8 @@ async def admin_add(message: Message, state: FSMContext):
         )
 
 @router.message(Command("del"))
-async def admin_delete(message: Message, state: FSMContext):
-    if not await is_user_admin(message.from_user.id): 
+async def admin_delete(message: Message, state: FSMContext, is_admin: bool = False):
+    if not is_admin: 
         return
         
     await state.clear()
@@ -740,35 +894,29 @@ async def admin_delete(message: Message, state: FSMContext):
             )
             return
         
-        project_id = project['id']
-        category = project['category']
-        score = project['score']
+        # Проект, счетчик отзывов, фото и копия в deleted_projects — одной транзакцией
+        deleted = await db.delete_project(
+            project['id'],
+            message.from_user.id,
+            message.from_user.username,
+            DELETE_INLINE_LIMIT
+        )
+        if not deleted:
+            await message.reply("❌ Проект уже удален.")
+            return
         
-        # Считаем сколько отзывов удаляем
-        reviews_count = supabase.table("user_logs").select("*").eq("project_id", project_id).execute()
-        reviews_num = len(reviews_count.data) if reviews_count.data else 0
+        project_id = deleted['project_id']
+        category = deleted['category']
+        score = deleted['score']
+        reviews_num = deleted['reviews_count']
         
-        # Добавляем запись в историю
-        supabase.table("rating_history").insert({
-            "project_id": project_id,
-            "admin_id": message.from_user.id,
-            "admin_username": message.from_user.username,
-            "change_type": "delete",
-            "score_before": score,
-            "score_after": 0,
-            "change_amount": -score,
-            "reason": "Удаление проекта",
-            "is_admin_action": True
-        }).execute()
-        
-        # Удаление проекта и связанных отзывов
-        supabase.table("projects").delete().eq("id", project_id).execute()
-        supabase.table("user_logs").delete().eq("project_id", project_id).execute()
-        supabase.table("rating_history").delete().eq("project_id", project_id).execute()
-        supabase.table("project_photos").delete().eq("project_id", project_id).execute()
+        photo_cache.invalidate(project_id)
+        weekly_top_engine.remove_project(project_id)
+        search_index.remove(project_id)
+        leaderboard.mark_dirty()
         
         # Отправляем лог
-        project_name_escaped = escape(str(project['name']))
+        project_name_escaped = escape(str(deleted['project_name']))
         log_text = (f"🗑 <b>Проект удален:</b>\n\n"
                    f"🏷 Название: <b>{project_name_escaped}</b>\n"
                    f"📂 Категория: <code>{category}</code>\n"
@@ -776,7 +924,7 @@ async def admin_delete(message: Message, state: FSMContext):
                    f"🔢 Финальный рейтинг: {score}\n"
                    f"👤 Админ: @{message.from_user.username or message.from_user.id}")
         
-        await send_log_to_topics(log_text, category)
+        await send_log_to_topics(log_text, category, priority=True)
         
         await message.reply(
             f"🗑 Проект <b>{project_name_escaped}</b> удален!\n"
@@ -792,8 +940,8 @@ async def admin_delete(message: Message, state: FSMContext):
         )
 
 @router.message(Command("score"))
-async def admin_score(message: Message, state: FSMContext):
-    if not await is_user_admin(message.from_user.id): 
+async def admin_score(message: Message, state: FSMContext, is_admin: bool = False):
+    if not is_admin: 
         return
         
     try:
@@ -837,7 +985,9 @@ async def admin_score(message: Message, state: FSMContext):
             )
             return
         
-        await state.update_data(
+        await advance_state(
+            state,
+            AdminScoreState.waiting_for_reason,
             project_id=project['id'],
             project_name=project['name'],
             category=project['category'],
@@ -845,8 +995,6 @@ async def admin_score(message: Message, state: FSMContext):
             change_amount=val
         )
         
-        await state.set_state(AdminScoreState.waiting_for_reason)
-        
         project_name_escaped = escape(str(project['name']))
         await message.reply(
             f"📝 <b>Укажите причину изменения рейтинга для проекта <i>{project_name_escaped}</i>:</b>\n\n"
@@ -879,28 +1027,27 @@ async def admin_score_reason(message: Message, state: FSMContext):
         return
     
     try:
-        project_id = data['project_id']
-        project_name = data['project_name']
-        category = data['category']
-        old_score = data['old_score']
-        change_amount = data['change_amount']
-        new_score = old_score + change_amount
-        
-        # Обновляем рейтинг проекта
-        supabase.table("projects").update({"score": new_score}).eq("id", project_id).execute()
-        
-        # Добавляем запись в историю
-        supabase.table("rating_history").insert({
-            "project_id": project_id,
-            "admin_id": message.from_user.id,
-            "admin_username": message.from_user.username,
-            "change_type": "admin_change",
-            "score_before": old_score,
-            "score_after": new_score,
-            "change_amount": change_amount,
-            "reason": reason,
-            "is_admin_action": True
-        }).execute()
+        # Рейтинг и история меняются одной транзакцией на стороне базы
+        result = await db.admin_change_score(
+            data['project_id'], message.from_user.id, message.from_user.username,
+            data['change_amount'], reason
+        )
+        if not result:
+            await message.reply("❌ Проект не найден!")
+            await state.clear()
+            return
+        
+        project_name = result['project_name']
+        category = result['category']
+        old_score = result['score_before']
+        new_score = result['score_after']
+        change_amount = result['change_amount']
+        weekly_top_engine.record(
+            {"id": result['project_id'], "name": project_name, "category": category, "score": new_score},
+            change_amount
+        )
+        search_index.set_score(result['project_id'], new_score)
+        leaderboard.mark_dirty()
         
         # Отправляем лог
         project_name_escaped = escape(str(project_name))
@@ -935,8 +1082,8 @@ async def admin_score_reason(message: Message, state: FSMContext):
     await state.clear()
 
 @router.message(Command("delrev"))
-async def admin_delrev(message: Message, state: FSMContext):
-    if not await is_user_admin(message.from_user.id): 
+async def admin_delrev(message: Message, state: FSMContext, is_admin: bool = False):
+    if not is_admin: 
         return
         
     await state.clear()
@@ -960,47 +1107,22 @@ async def admin_delrev(message: Message, state: FSMContext):
             )
             return
         
-        rev_result = supabase.table("user_logs").select("*").eq("id", log_id).execute()
-        if not rev_result.data:
+        # История, откат рейтинга и удаление отзыва — одной транзакцией
+        rev = await db.delete_review(log_id, message.from_user.id, message.from_user.username)
+        if not rev:
             await message.reply(
                 f"❌ Отзыв <b>#{log_id}</b> не найден!",
                 parse_mode="HTML"
             )
             return
         
-        rev = rev_result.data[0]
-        
-        project_result = supabase.table("projects").select("*").eq("id", rev['project_id']).execute()
-        if not project_result.data:
-            await message.reply(
-                f"❌ Проект отзыва #{log_id} не найден!"
-            )
-            return
-        
-        project = project_result.data[0]
-        old_score = project['score']
-        rating_change = RATING_MAP.get(rev['rating_val'], 0)
-        new_score = old_score - rating_change
-        
-        # Добавляем запись в историю об удалении отзыва
-        supabase.table("rating_history").insert({
-            "project_id": rev['project_id'],
-            "admin_id": message.from_user.id,
-            "admin_username": message.from_user.username,
-            "change_type": "delete_review",
-            "score_before": old_score,
-            "score_after": new_score,
-            "change_amount": -rating_change,
-            "reason": f"Удаление отзыва #{log_id} (оценка: {rev['rating_val']}/5)",
-            "is_admin_action": True,
-            "related_review_id": log_id
-        }).execute()
-        
-        # Обновляем рейтинг проекта
-        supabase.table("projects").update({"score": new_score}).eq("id", rev['project_id']).execute()
-        
-        # Удаляем отзыв
-        supabase.table("user_logs").delete().eq("id", log_id).execute()
+        project = {"id": rev['project_id'], "name": rev['project_name'], "category": rev['category']}
+        old_score = rev['score_before']
+        new_score = rev['score_after']
+        rating_change = -rev['change_amount']
+        weekly_top_engine.record({**project, "score": new_score}, rev['change_amount'])
+        search_index.set_score(project['id'], new_score)
+        leaderboard.mark_dirty()
         
         # Отправляем лог
         project_name_escaped = escape(str(project['name']))
@@ -1015,7 +1137,7 @@ async def admin_delrev(message: Message, state: FSMContext):
                    f"📝 Текст отзыва: <i>{review_text_escaped[:100]}...</i>\n"
                    f"👤 Удалил: @{message.from_user.username or message.from_user.id}")
         
-        await send_log_to_topics(log_text, project['category'])
+        await send_log_to_topics(log_text, project['category'], priority=True)
         
         await message.reply(
             f"🗑 Отзыв <b>#{log_id}</b> удален!\n"
@@ -1033,9 +1155,9 @@ async def admin_delrev(message: Message, state: FSMContext):
 # --- ДОПОЛНИТЕЛЬНЫЕ АДМИН-КОМАНДЫ ---
 
 @router.message(Command("editdesc"))
-async def admin_edit_desc(message: Message):
+async def admin_edit_desc(message: Message, is_admin: bool = False):
     """Изменить описание проекта"""
-    if not await is_user_admin(message.from_user.id): 
+    if not is_admin: 
         return
         
     try:
@@ -1075,7 +1197,9 @@ async def admin_edit_desc(message: Message):
         old_desc = project['description']
         
         # Обновляем описание
-        supabase.table("projects").update({"description": new_desc}).eq("id", project['id']).execute()
+        await db.update_project(project['id'], {"description": new_desc})
+        search_index.add({**project, "description": new_desc})
+        leaderboard.mark_dirty()
         
         # Отправляем лог
         project_name_escaped = escape(str(project['name']))
@@ -1103,9 +1227,9 @@ async def admin_edit_desc(message: Message):
         )
 
 @router.message(Command("addphoto"))
-async def admin_add_photo(message: Message, state: FSMContext):
+async def admin_add_photo(message: Message, state: FSMContext, is_admin: bool = False):
     """Добавить фото к проекту"""
-    if not await is_user_admin(message.from_user.id): 
+    if not is_admin: 
         return
         
     try:
@@ -1132,12 +1256,13 @@ async def admin_add_photo(message: Message, state: FSMContext):
             return
         
         # Сохраняем данные в state и ждем фото
-        await state.update_data(
+        await advance_state(
+            state,
+            EditProjectState.waiting_for_photo,
             project_id=project['id'],
             project_name=project['name'],
             category=project['category']
         )
-        await state.set_state(EditProjectState.waiting_for_photo)
         
         project_name_escaped = escape(str(project['name']))
         await message.reply(
@@ -1202,9 +1327,9 @@ async def admin_wrong_photo(message: Message):
     )
 
 @router.message(Command("stats"))
-async def admin_stats(message: Message):
+async def admin_stats(message: Message, is_admin: bool = False):
     """Показать статистику проекта"""
-    if not await is_user_admin(message.from_user.id): 
+    if not is_admin: 
         return
         
     try:
@@ -1233,33 +1358,10 @@ async def admin_stats(message: Message):
         project_name_escaped = escape(str(project['name']))
         category_escaped = escape(str(project['category']))
         
-        # Получаем статистику
-        reviews_result = supabase.table("user_logs")\
-            .select("*")\
-            .eq("project_id", project['id'])\
-            .eq("action_type", "review")\
-            .execute()
-        
-        likes_result = supabase.table("user_logs")\
-            .select("*")\
-            .eq("project_id", project['id'])\
-            .eq("action_type", "like")\
-            .execute()
-        
-        history_result = supabase.table("rating_history")\
-            .select("*")\
-            .eq("project_id", project['id'])\
-            .execute()
-        
-        reviews = reviews_result.data if reviews_result.data else []
-        likes = likes_result.data if likes_result.data else []
-        history = history_result.data if history_result.data else []
-        
-        # Считаем среднюю оценку
-        avg_rating = 0
-        if reviews:
-            total_rating = sum([r['rating_val'] for r in reviews])
-            avg_rating = total_rating / len(reviews)
+        # Получаем статистику (считается в базе, приходит одной строкой)
+        stats = await db.get_project_stats(project['id']) or {}
+        reviews_count = stats.get('reviews_count') or 0
+        avg_rating = float(stats.get('avg_rating') or 0)
         
         text = f"<b>📊 СТАТИСТИКА ПРОЕКТА</b>\n\n"
         text += f"🏷 <b>{project_name_escaped}</b>\n"
@@ -1268,21 +1370,17 @@ async def admin_stats(message: Message):
         text += f"🔢 Текущий рейтинг: <b>{project['score']}</b>\n"
         text += f"⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯\n"
         text += f"📈 <b>Общая статистика:</b>\n"
-        text += f"• 💬 Отзывов: {len(reviews)}\n"
-        text += f"• ❤️ Лайков: {len(likes)}\n"
+        text += f"• 💬 Отзывов: {reviews_count}\n"
+        text += f"• ❤️ Лайков: {stats.get('likes_count') or 0}\n"
         text += f"• ⭐ Средняя оценка: {avg_rating:.1f}/5\n"
-        text += f"• 📊 Всего изменений рейтинга: {len(history)}\n\n"
+        text += f"• 📊 Всего изменений рейтинга: {stats.get('history_count') or 0}\n\n"
         
-        if reviews:
+        if reviews_count:
             # Распределение оценок
-            rating_dist = {1:0, 2:0, 3:0, 4:0, 5:0}
-            for r in reviews:
-                rating_dist[r['rating_val']] += 1
-            
             text += f"📊 <b>Распределение оценок:</b>\n"
             for rating in range(5, 0, -1):
-                count = rating_dist[rating]
-                percent = (count / len(reviews)) * 100 if reviews else 0
+                count = stats.get(f'rating_{rating}') or 0
+                percent = (count / reviews_count) * 100
                 text += f"{'⭐' * rating}: {count} ({percent:.1f}%)\n"
         
         # Получаем фото проекта
@@ -1307,89 +1405,61 @@ async def admin_stats(message: Message):
         )
 
 @router.message(Command("list"))
-async def admin_list_projects(message: Message):
+async def admin_list_projects(message: Message, is_admin: bool = False):
     """Список всех проектов"""
-    if not await is_user_admin(message.from_user.id): 
+    if not is_admin: 
         return
         
     try:
-        # Отправляем сообщение о загрузке
         loading_msg = await message.reply("⏳ Загружаем список проектов...")
         
-        # Получаем все проекты
-        projects = supabase.table("projects").select("*").order("score", desc=True).execute().data
-        
-        if not projects:
-            await loading_msg.delete()
-            await message.reply("📭 Список проектов пуст.")
+        # Снимок отчета: проекты читаются кусками по id, в Telegram уходит только первая страница
+        projects = []
+        total_reviews = 0
+        async for rows in db.iter_projects():
+            # Счетчики отзывов только для проектов этого куска
+            counters = await db.get_project_counters_many([p['id'] for p in rows])
+            for p in rows:
+                reviews_num = counters[p['id']]['review_count'] if p['id'] in counters else 0
+                total_reviews += reviews_num
+                projects.append({**p, "review_count": reviews_num})
+        
+        # По убыванию рейтинга: первый — лидер
+        projects.sort(key=lambda p: (-p['score'], p['id']))
+        top_project = projects[0] if projects else None
+        entries = []
+        for p in projects:
+            # Экранируем специальные символы в данных
+            project_name = escape(str(p['name']))
+            category = escape(str(p['category']))
+            
+            entry = f"<b>{len(entries) + 1}. {project_name}</b>\n"
+            entry += f"   🆔 ID: <code>{p['id']}</code>\n"
+            entry += f"   📂 Категория: <code>{category}</code>\n"
+            entry += f"   🔢 Рейтинг: <b>{p['score']}</b>\n"
+            entry += f"   💬 Отзывов: {p['review_count']}\n"
+            entry += f"   ⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯\n"
+            entries.append(entry)
+        
+        if not entries:
+            await loading_msg.edit_text("📭 Список проектов пуст.")
             return
         
-        # Получаем все отзывы одним запросом
-        all_reviews = supabase.table("user_logs")\
-            .select("project_id")\
-            .eq("action_type", "review")\
-            .execute().data
-        
-        # Создаем словарь: project_id -> количество отзывов
-        review_counts = {}
-        for review in all_reviews:
-            project_id = review['project_id']
-            review_counts[project_id] = review_counts.get(project_id, 0) + 1
-        
-        # Удаляем сообщение о загрузке
-        await loading_msg.delete()
-        
-        # Отправляем общую статистику
-        total_projects = len(projects)
-        total_reviews = len(all_reviews)
-        
-        stats_text = (
+        total_projects = len(entries)
+        title = (
             f"<b>📊 ОБЩАЯ СТАТИСТИКА</b>\n\n"
             f"📋 Всего проектов: <b>{total_projects}</b>\n"
             f"💬 Всего отзывов: <b>{total_reviews}</b>\n"
-            f"📈 Среднее отзывов на проект: <b>{total_reviews/total_projects:.1f}</b>\n\n"
-            f"<i>Отправляю список проектов...</i>"
+            f"📈 Среднее отзывов на проект: <b>{total_reviews/total_projects:.1f}</b>\n"
+            f"⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯\n\n"
         )
-        
-        await message.reply(stats_text, parse_mode="HTML")
-        
-        # Разбиваем проекты на части по 20 штук
-        chunk_size = 20
-        for chunk_num in range(0, len(projects), chunk_size):
-            chunk = projects[chunk_num:chunk_num + chunk_size]
-            
-            text = f"<b>📋 ПРОЕКТЫ {chunk_num+1}-{min(chunk_num+chunk_size, total_projects)} из {total_projects}</b>\n\n"
-            
-            for i, p in enumerate(chunk, start=chunk_num+1):
-                # Получаем количество отзывов из словаря
-                reviews_num = review_counts.get(p['id'], 0)
-                
-                # Экранируем специальные символы в данных
-                project_name = escape(str(p['name']))
-                category = escape(str(p['category']))
-                
-                text += f"<b>{i}. {project_name}</b>\n"
-                text += f"   🆔 ID: <code>{p['id']}</code>\n"
-                text += f"   📂 Категория: <code>{category}</code>\n"
-                text += f"   🔢 Рейтинг: <b>{p['score']}</b>\n"
-                text += f"   💬 Отзывов: {reviews_num}\n"
-                text += f"   ⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯\n"
-            
-            # Если это последний чанк, добавляем итоговую статистику
-            if chunk_num + chunk_size >= total_projects:
-                # Находим проект с максимальным рейтингом
-                top_project = max(projects, key=lambda x: x['score'])
-                top_project_name = escape(str(top_project['name']))
-                
-                text += f"\n<b>🏆 ЛИДЕР:</b>\n"
-                text += f"<b>{top_project_name}</b> — <code>{top_project['score']}</code> баллов\n"
-                text += f"💬 Отзывов: {review_counts.get(top_project['id'], 0)}"
-            
-            await message.answer(text, parse_mode="HTML")
-            
-            # Небольшая пауза между сообщениями
-            if chunk_num + chunk_size < total_projects:
-                await asyncio.sleep(0.5)
+        top_project_name = escape(str(top_project['name']))
+        footer = (
+            f"\n<b>🏆 ЛИДЕР:</b>\n"
+            f"<b>{top_project_name}</b> — <code>{top_project['score']}</code> баллов\n"
+            f"💬 Отзывов: {top_project['review_count']}"
+        )
+        await show_report(loading_msg, Report(title, entries, footer))
         
     except Exception as e:
         logging.error(f"Ошибка в /list: {e}")
@@ -1397,12 +1467,64 @@ async def admin_list_projects(message: Message):
             f"❌ Ошибка при получении списка проектов: {str(e)[:100]}"
         )
 
+# --- ПОСТРАНИЧНЫЕ ОТЧЕТЫ ---
+async def show_report(message: Message, report: Report):
+    """Сохраняет снимок и показывает первую страницу.
+    
+    Сообщение бота (например, "⏳ Загружаем...") редактируется, на команду — отвечаем.
+    """
+    report_id = report_cache.add(report)
+    text, kb = report.render(0), report_kb(report_id, report, 0)
+    if message.from_user and message.from_user.id == bot.id:
+        await message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+    else:
+        await message.reply(text, reply_markup=kb, parse_mode="HTML")
+
+@router.callback_query(F.data.startswith(CALLBACK_PREFIX))
+async def report_page(call: CallbackQuery, is_admin: bool = False):
+    """Страница отчета из снимка — то же сообщение редактируется на месте"""
+    if not is_admin:
+        await call.answer()
+        return
+    
+    try:
+        report_id, page = parse_callback(call.data)
+    except ValueError:
+        await call.answer("❌ Неверный формат", show_alert=True)
+        return
+    
+    report = report_cache.get(report_id)
+    if report is None:
+        await call.answer("⌛ Отчет устарел, запросите его командой еще раз.", show_alert=True)
+        return
+    if not 0 <= page < len(report.pages):
+        await call.answer()
+        return
+    
+    try:
+        await call.message.edit_text(report.render(page), reply_markup=report_kb(report_id, report, page),
+                                      parse_mode="HTML")
+    except Exception as e:
+        # Нажатие на текущую страницу ("N/M") ничего не меняет
+        if "message is not modified" not in str(e):
+            logging.error(f"Ошибка показа страницы отчета: {e}")
+    await call.answer()
+
 # --- КОМАНДЫ УПРАВЛЕНИЯ БАНОМ ---
 
+def set_ban(user_id: int, ban):
+    """Бан (ban=None — снятие) в индексе этого процесса и остальных воркеров"""
+    if ban:
+        ban_index.add(ban)
+    else:
+        ban_index.remove(user_id)
+    # Пользователя может обслуживать другой воркер: он должен узнать о бане сразу
+    broadcast_control({"ban": {"user_id": user_id, "ban": ban}})
+
 @router.message(Command("ban"))
-async def admin_ban(message: Message):
+async def admin_ban(message: Message, is_admin: bool = False):
     """Забанить пользователя"""
-    if not await is_user_admin(message.from_user.id): 
+    if not is_admin: 
         return
     
     try:
@@ -1437,13 +1559,11 @@ async def admin_ban(message: Message):
             )
             return
         
-        # Проверяем, не забанен ли уже
-        existing = supabase.table("banned_users")\
-            .select("*")\
-            .eq("user_id", user_id)\
-            .execute()
+        # Проверяем, не забанен ли уже (по базе — она главный источник)
+        existing = await db.get_ban(user_id)
         
-        if existing.data:
+        if existing:
+            set_ban(user_id, existing)
             await message.reply(
                 f"⚠️ Пользователь <code>{user_id}</code> уже забанен!",
                 parse_mode="HTML"
@@ -1451,15 +1571,17 @@ async def admin_ban(message: Message):
             return
         
         # Баним пользователя
-        result = supabase.table("banned_users").insert({
+        created = await db.insert_ban({
             "user_id": user_id,
             "banned_by": message.from_user.id,
             "banned_by_username": message.from_user.username,
             "reason": reason,
             "banned_at": "now()"
-        }).execute()
+        })
         
-        if result.data:
+        if created:
+            set_ban(user_id, created)
+            
             # Отправляем лог
             reason_escaped = escape(reason)
             log_text = (f"🚫 <b>Пользователь забанен:</b>\n\n"
@@ -1467,7 +1589,7 @@ async def admin_ban(message: Message):
                        f"📝 Причина: <i>{reason_escaped}</i>\n"
                        f"👮 Админ: @{message.from_user.username or message.from_user.id}")
             
-            await send_log_to_topics(log_text)
+            await send_log_to_topics(log_text, priority=True)
             
             reason_escaped = escape(reason)
             await message.reply(
@@ -1487,9 +1609,9 @@ async def admin_ban(message: Message):
         )
 
 @router.message(Command("unban"))
-async def admin_unban(message: Message):
+async def admin_unban(message: Message, is_admin: bool = False):
     """Разбанить пользователя"""
-    if not await is_user_admin(message.from_user.id): 
+    if not is_admin: 
         return
     
     try:
@@ -1515,12 +1637,10 @@ async def admin_unban(message: Message):
             return
         
         # Проверяем, есть ли пользователь в бане
-        existing = supabase.table("banned_users")\
-            .select("*")\
-            .eq("user_id", user_id)\
-            .execute()
+        existing = await db.get_ban(user_id)
         
-        if not existing.data:
+        if not existing:
+            set_ban(user_id, None)
             await message.reply(
                 f"⚠️ Пользователь <code>{user_id}</code> не находится в бане!",
                 parse_mode="HTML"
@@ -1528,17 +1648,15 @@ async def admin_unban(message: Message):
             return
         
         # Удаляем из бана
-        supabase.table("banned_users")\
-            .delete()\
-            .eq("user_id", user_id)\
-            .execute()
+        await db.delete_ban(user_id)
+        set_ban(user_id, None)
         
         # Отправляем лог
         log_text = (f"✅ <b>Пользователь разбанен:</b>\n\n"
                    f"🆔 ID: <code>{user_id}</code>\n"
                    f"👮 Админ: @{message.from_user.username or message.from_user.id}")
         
-        await send_log_to_topics(log_text)
+        await send_log_to_topics(log_text, priority=True)
         
         await message.reply(
             f"✅ Пользователь <code>{user_id}</code> разбанен!",
@@ -1552,44 +1670,42 @@ async def admin_unban(message: Message):
         )
 
 @router.message(Command("banlist"))
-async def admin_banlist(message: Message):
+async def admin_banlist(message: Message, is_admin: bool = False):
     """Показать список забаненных пользователей"""
-    if not await is_user_admin(message.from_user.id): 
+    if not is_admin: 
         return
     
     try:
-        banned_users = supabase.table("banned_users")\
-            .select("*")\
-            .order("banned_at", desc=True)\
-            .execute().data
-    
-        if not banned_users:
-            await message.reply("📭 Список забаненных пользователей пуст.")
-            return
-    
-        text = "<b>🚫 СПИСОК ЗАБАНЕННЫХ ПОЛЬЗОВАТЕЛЕЙ</b>\n\n"
-    
-        for i, ban in enumerate(banned_users, 1):
+        banned_users = []
+        async for chunk in db.iter_bans():
+            banned_users.extend(chunk)
+        # Новые баны первыми
+        banned_users.sort(key=lambda ban: ban['banned_at'] or "", reverse=True)
+        
+        entries = []
+        for ban in banned_users:
             # Форматируем дату
             banned_at = ban['banned_at'][:19] if ban['banned_at'] else "Неизвестно"
             reason_escaped = escape(str(ban.get('reason', 'Не указана')))
             banned_by_escaped = escape(str(ban.get('banned_by_username', ban.get('banned_by', 'Неизвестно'))))
     
-            text += f"<b>{i}. ID:</b> <code>{ban['user_id']}</code>\n"
-            text += f"   <b>Причина:</b> <i>{reason_escaped}</i>\n"
-            text += f"   <b>Забанен:</b> {banned_at}\n"
-            text += f"   <b>Админ:</b> {banned_by_escaped}\n"
-            text += f"   ⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯\n"
+            entry = f"<b>{len(entries) + 1}. ID:</b> <code>{ban['user_id']}</code>\n"
+            entry += f"   <b>Причина:</b> <i>{reason_escaped}</i>\n"
+            entry += f"   <b>Забанен:</b> {banned_at}\n"
+            entry += f"   <b>Админ:</b> {banned_by_escaped}\n"
+            entry += f"   ⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯\n"
+            entries.append(entry)
     
-        text += f"\n📊 Всего забанено: <b>{len(banned_users)}</b> пользователей"
+        if not entries:
+            await message.reply("📭 Список забаненных пользователей пуст.")
+            return
     
-        # Разбиваем на части если слишком длинное
-        if len(text) > 4000:
-            parts = [text[i:i+4000] for i in range(0, len(text), 4000)]
-            for part in parts:
-                await message.answer(part, parse_mode="HTML")
-        else:
-            await message.reply(text, parse_mode="HTML")
+        report = Report(
+            "<b>🚫 СПИСОК ЗАБАНЕННЫХ ПОЛЬЗОВАТЕЛЕЙ</b>\n\n",
+            entries,
+            f"\n📊 Всего забанено: <b>{len(entries)}</b> пользователей"
+        )
+        await show_report(message, report)
     
     except Exception as e:
         logging.error(f"Ошибка в /banlist: {e}")
@@ -1597,19 +1713,34 @@ async def admin_banlist(message: Message):
             "❌ Ошибка при получении списка банов."
         )
 
+@router.message(Command("reconcile"))
+async def admin_reconcile(message: Message, is_admin: bool = False):
+    """Пересобрать счетчики отзывов и лайков из user_logs"""
+    if not is_admin: 
+        return
+    
+    try:
+        loading_msg = await message.reply("⏳ Пересчитываем счетчики проектов...")
+        projects_count = await db.reconcile_project_counters()
+        await loading_msg.edit_text(
+            f"✅ Счетчики пересобраны для <b>{projects_count}</b> проектов.",
+            parse_mode="HTML"
+        )
+    
+    except Exception as e:
+        logging.error(f"Ошибка в /reconcile: {e}")
+        await message.reply(
+            "❌ Ошибка при пересчете счетчиков."
+        )
+
 @router.message(Command("mystatus"))
-async def check_my_status(message: Message):
+async def check_my_status(message: Message, is_admin: bool = False):
     """Проверить свой статус (админ/бан)"""
     user_id = message.from_user.id
     
     # Проверяем бан
-    ban_result = supabase.table("banned_users")\
-        .select("*")\
-        .eq("user_id", user_id)\
-        .execute()
+    ban = ban_index.get(user_id)
     
-    # Проверяем админку
-    is_admin = await is_user_admin(user_id)
     
     text = f"<b>👤 ВАШ СТАТУС</b>\n\n"
     text += f"🆔 ID: <code>{user_id}</code>\n"
@@ -1620,12 +1751,12 @@ async def check_my_status(message: Message):
     if is_admin:
         text += "✅ <b>Статус: АДМИНИСТРАТОР</b>\n"
         text += "Вы имеете доступ ко всем командам управления."
-    elif ban_result.data:
-        reason_escaped = escape(str(ban_result.data[0].get('reason', 'Не указана')))
+    elif ban:
+        reason_escaped = escape(str(ban.get('reason', 'Не указана')))
         text += "🚫 <b>Статус: ЗАБЛОКИРОВАН</b>\n"
         text += f"📝 Причина: <i>{reason_escaped}</i>\n"
-        if ban_result.data[0].get('banned_at'):
-            text += f"📅 Дата блокировки: {ban_result.data[0].get('banned_at')[:10]}"
+        if ban.get('banned_at'):
+            text += f"📅 Дата блокировки: {ban.get('banned_at')[:10]}"
     else:
         text += "✅ <b>Статус: ПОЛЬЗОВАТЕЛЬ</b>\n"
         text += "Вы можете оставлять отзывы и ставить лайки."
@@ -1633,9 +1764,9 @@ async def check_my_status(message: Message):
     await message.reply(text, parse_mode="HTML")
 
 @router.message(Command("finduser"))
-async def admin_find_user(message: Message):
+async def admin_find_user(message: Message, is_admin: bool = False):
     """Найти информацию о пользователе"""
-    if not await is_user_admin(message.from_user.id): 
+    if not is_admin: 
         return
     
     try:
@@ -1650,46 +1781,53 @@ async def admin_find_user(message: Message):
         
         query = message.text.split(maxsplit=1)[1].strip()
         
+        # Поиск по ID или по username — один запрос к агрегату по индексам
         try:
-            user_id = int(query)
-            # Ищем по ID в banned_users
-            ban_result = supabase.table("banned_users")\
-                .select("*")\
-                .eq("user_id", user_id)\
-                .execute()
+            activity = await db.find_user_activity(user_id=int(query))
         except ValueError:
-            # Если не число, ищем в логах
-            user_logs = supabase.table("user_logs")\
-                .select("user_id")\
-                .execute()
-            
-            # Это упрощенный поиск
-            user_id = None
-            ban_result = None
+            activity = await db.find_user_activity(username=query.lstrip("@"))
         
         text = f"<b>🔍 ПОИСК ПОЛЬЗОВАТЕЛЯ</b>\n\n"
         query_escaped = escape(query)
         text += f"🔎 Запрос: <code>{query_escaped}</code>\n"
         text += f"⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯\n"
         
-        if ban_result and ban_result.data:
-            ban = ban_result.data[0]
-            reason_escaped = escape(str(ban.get('reason', 'Не указана')))
-            banned_by_escaped = escape(str(ban.get('banned_by_username', ban.get('banned_by', 'Неизвестно'))))
+        if not activity:
+            text += "Пользователь не найден."
+            await message.reply(text, parse_mode="HTML")
+            return
+        
+        user_id = activity['user_id']
+        if activity['is_banned']:
+            reason_escaped = escape(str(activity.get('ban_reason') or 'Не указана'))
+            banned_by_escaped = escape(str(activity.get('banned_by_username') or 'Неизвестно'))
             
             text += f"🚫 <b>СТАТУС: ЗАБАНЕН</b>\n\n"
-            text += f"🆔 ID: <code>{ban['user_id']}</code>\n"
             text += f"📝 Причина: <i>{reason_escaped}</i>\n"
-            if ban.get('banned_at'):
-                text += f"📅 Дата: {ban['banned_at'][:10]}\n"
+            if activity.get('banned_at'):
+                text += f"📅 Дата: {activity['banned_at'][:10]}\n"
             text += f"👮 Админ: {banned_by_escaped}\n\n"
-            text += f"<i>Используйте</i> <code>/unban {ban['user_id']}</code> <i>для разблокировки</i>"
-        elif user_id:
+        else:
             text += f"✅ <b>СТАТУС: НЕ ЗАБАНЕН</b>\n\n"
-            text += f"🆔 ID: <code>{user_id}</code>\n\n"
-            text += f"<i>Используйте</i> <code>/ban {user_id} причина</code> <i>для блокировки</i>"
+        
+        text += f"🆔 ID: <code>{user_id}</code>\n"
+        if activity.get('username'):
+            text += f"👤 Username: @{escape(activity['username'])}\n"
+        text += f"💬 Отзывов: {activity['reviews_count']} | ❤️ Лайков: {activity['likes_count']}\n"
+        if activity.get('last_activity_at'):
+            text += f"🕐 Последняя активность: {activity['last_activity_at'][:16].replace('T', ' ')}\n"
+        
+        projects = activity.get('projects') or []
+        text += f"📂 Проектов затронуто: {activity['projects_count']}\n"
+        for p in projects:
+            text += f"   • {escape(str(p['name']))} (ID: <code>{p['id']}</code>)\n"
+        if activity['projects_count'] > len(projects):
+            text += f"   <i>...и еще {activity['projects_count'] - len(projects)}</i>\n"
+        
+        if activity['is_banned']:
+            text += f"\n<i>Используйте</i> <code>/unban {user_id}</code> <i>для разблокировки</i>"
         else:
-            text += "Пользователь не найден."
+            text += f"\n<i>Используйте</i> <code>/ban {user_id} причина</code> <i>для блокировки</i>"
         
         await message.reply(text, parse_mode="HTML")
         
@@ -1705,24 +1843,21 @@ async def cmd_start(message: Message, state: FSMContext):
     await state.clear()
     
     # Проверяем бан
-    ban_result = supabase.table("banned_users")\
-        .select("*")\
-        .eq("user_id", message.from_user.id)\
-        .execute()
+    ban = ban_index.get(message.from_user.id)
     
-    if ban_result.data:
-        reason_escaped = escape(str(ban_result.data[0].get('reason', 'Не указана')))
+    if ban:
+        reason_escaped = escape(str(ban.get('reason', 'Не указана')))
         await message.answer(
             f"🚫 <b>Вы заблокированы!</b>\n\n"
             f"📝 Причина: <i>{reason_escaped}</i>\n"
-            f"📅 Дата блокировки: {ban_result.data[0].get('banned_at', 'Неизвестно')[:10]}\n\n"
+            f"📅 Дата блокировки: {(ban.get('banned_at') or 'Неизвестно')[:10]}\n\n"
             f"Для разблокировки обратитесь к администратору.",
             parse_mode="HTML"
         )
         return
     
     # Получаем топ проектов
-    top_projects = supabase.table("projects").select("*").order("score", desc=True).limit(5).execute().data
+    top_projects = await db.list_top_projects(5)
     
     # Стартовое сообщение
     start_text = "<b>🌟 ДОБРО ПОЖАЛОВАТЬ В РЕЙТИНГ ПРОЕКТОВ КМБП!</b>\n\n"
@@ -1756,7 +1891,7 @@ async def cmd_start(message: Message, state: FSMContext):
 async def show_cat(message: Message):
     """Показать первую партию проектов категории"""
     cat_key = [k for k, v in CATEGORIES.items() if v == message.text][0]
-    await show_projects_batch(cat_key, 0, message, is_first_batch=True)
+    await show_projects_batch(cat_key, None, 0, message, is_first_batch=True)
 
 # --- ОСНОВНЫЕ ОБРАБОТЧИКИ ПРОЕКТОВ ---
 @router.callback_query(F.data.startswith("panel_"))
@@ -1770,25 +1905,13 @@ async def open_panel(call: CallbackQuery):
         await call.answer("Проект не найден.", show_alert=True)
         return
     
-    # Проверяем, есть ли у пользователя отзыв
-    user_review = supabase.table("user_logs")\
-        .select("*")\
-        .eq("user_id", call.from_user.id)\
-        .eq("project_id", p_id)\
-        .eq("action_type", "review")\
-        .execute()
-    
-    has_review = bool(user_review.data)
-    
-    # Получаем фото проекта
-    photo_file_id = await get_project_photo(int(p_id))
+    # Проверяем, есть ли у пользователя отзыв, и получаем последние изменения
+    user_review, recent_changes = await asyncio.gather(
+        db.get_user_action(call.from_user.id, int(p_id), "review"),
+        db.list_history(int(p_id), limit=2),
+    )
     
-    # Получаем последние изменения
-    recent_changes = supabase.table("rating_history").select("*")\
-        .eq("project_id", p_id)\
-        .order("created_at", desc=True)\
-        .limit(2)\
-        .execute().data
+    has_review = bool(user_review)
     
     # Экранируем данные
     project_name_escaped = escape(str(project['name']))
@@ -1857,25 +1980,19 @@ async def rev_start(call: CallbackQuery, state: FSMContext):
     p_id = call.data.split("_")[1]
     
     # Проверяем, не забанен ли пользователь
-    ban_result = supabase.table("banned_users")\
-        .select("*")\
-        .eq("user_id", call.from_user.id)\
-        .execute()
-    
-    if ban_result.data:
+    if call.from_user.id in ban_index:
         await call.answer("🚫 Вы заблокированы и не можете оставлять отзывы!", show_alert=True)
         return
     
-    check = supabase.table("user_logs").select("*").eq("user_id", call.from_user.id).eq("project_id", p_id).eq("action_type", "review").execute()
-    await state.update_data(p_id=p_id)
-    await state.set_state(ReviewState.waiting_for_text)
+    check = await db.get_user_action(call.from_user.id, int(p_id), "review")
+    await advance_state(state, ReviewState.waiting_for_text, p_id=p_id)
     
     project = await find_project_by_id(int(p_id))
     project_name = project['name'] if project else "Проект"
     
     project_name_escaped = escape(str(project_name))
     txt = f"📝 <b>Изменение отзыва для проекта {project_name_escaped}</b>\n\nВведите новый текст отзыва:"
-    if not check.data:
+    if not check:
         txt = f"💬 <b>Новый отзыв для проекта {project_name_escaped}</b>\n\nВведите текст отзыва. <b> Важно. Если вы пишите негативный отзыв, просим вас прикреплять аргументацию со ссылками на облачные хранилища, в противном случае мы будем вынуждены удалить Ваш отзыв </b>"
     
     if call.message.photo:
@@ -1902,8 +2019,7 @@ async def rev_text(message: Message, state: FSMContext):
     if message.text and message.text.startswith("/"): 
         return 
     
-    await state.update_data(txt=message.text)
-    await state.set_state(ReviewState.waiting_for_rate)
+    await advance_state(state, ReviewState.waiting_for_rate, txt=message.text)
     
     # Получаем ID проекта из state
     data = await state.get_data()
@@ -1919,64 +2035,27 @@ async def rev_end(call: CallbackQuery, state: FSMContext):
     p_id = data['p_id']
     
     # Проверяем, не забанен ли пользователь
-    ban_result = supabase.table("banned_users")\
-        .select("*")\
-        .eq("user_id", call.from_user.id)\
-        .execute()
-    
-    if ban_result.data:
+    if call.from_user.id in ban_index:
         await call.answer("🚫 Вы заблокированы и не можете оставлять отзывы!", show_alert=True)
         await state.clear()
         return
     
-    old_rev = supabase.table("user_logs").select("*").eq("user_id", call.from_user.id).eq("project_id", p_id).eq("action_type", "review").execute()
-    p = await find_project_by_id(int(p_id))
+    # Отзыв, рейтинг и история пишутся одной транзакцией на стороне базы
+    result = await db.submit_review(int(p_id), call.from_user.id, call.from_user.username, data['txt'], rate)
     
-    if not p:
+    if not result:
         await call.answer("❌ Проект не найден", show_alert=True)
         await state.clear()
         return
     
-    old_score = p['score']
-    rating_change = RATING_MAP[rate]
-    
-    if old_rev.data:
-        # Учитываем старую оценку при пересчете
-        old_rating_change = RATING_MAP[old_rev.data[0]['rating_val']]
-        rating_change = RATING_MAP[rate] - old_rating_change
-        new_score = old_score + rating_change
-        supabase.table("user_logs").update({"review_text": data['txt'], "rating_val": rate}).eq("id", old_rev.data[0]['id']).execute()
-        res_txt = "обновлен"
-        log_id = old_rev.data[0]['id']
-        reason = f"Изменение отзыва: {old_rev.data[0]['rating_val']}/5 → {rate}/5"
-    else:
-        new_score = old_score + rating_change
-        log = supabase.table("user_logs").insert({
-            "user_id": call.from_user.id, 
-            "project_id": p_id, 
-            "action_type": "review", 
-            "review_text": data['txt'], 
-            "rating_val": rate
-        }).execute()
-        res_txt = "добавлен"
-        log_id = log.data[0]['id']
-        reason = f"Новый отзыв: {rate}/5"
-
-    supabase.table("projects").update({"score": new_score}).eq("id", p_id).execute()
-    
-    # Добавляем запись в историю
-    supabase.table("rating_history").insert({
-        "project_id": p_id,
-        "user_id": call.from_user.id,
-        "username": call.from_user.username,
-        "change_type": "user_review",
-        "score_before": old_score,
-        "score_after": new_score,
-        "change_amount": rating_change,
-        "reason": reason,
-        "is_admin_action": False,
-        "related_review_id": log_id
-    }).execute()
+    p = {"id": result['project_id'], "name": result['project_name'], "category": result['category']}
+    new_score = result['score_after']
+    rating_change = result['change_amount']
+    res_txt = "обновлен" if result['is_update'] else "добавлен"
+    log_id = result['log_id']
+    weekly_top_engine.record({**p, "score": new_score}, rating_change)
+    search_index.set_score(p['id'], new_score)
+    leaderboard.mark_dirty()
     
     text = f"✅ <b>Отзыв успешно {res_txt}!</b>\n\n"
     text += f"📊 Изменение рейтинга: <code>{rating_change:+d}</code>\n"
@@ -2008,9 +2087,10 @@ async def rev_end(call: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data.startswith("viewrev_"))
 async def view_reviews(call: CallbackQuery):
     p_id = call.data.split("_")[1]
-    revs = supabase.table("user_logs").select("*").eq("project_id", p_id).eq("action_type", "review").order("created_at", desc=True).limit(5).execute().data
-    
-    project = await find_project_by_id(int(p_id))
+    revs, project = await asyncio.gather(
+        db.list_project_logs(int(p_id), "review", limit=5),
+        find_project_by_id(int(p_id)),
+    )
     project_name = project['name'] if project else "Проект"
     
     if not revs: 
@@ -2053,11 +2133,7 @@ async def view_history(call: CallbackQuery):
         return
     
     # Получаем историю изменений
-    history = supabase.table("rating_history").select("*")\
-        .eq("project_id", p_id)\
-        .order("created_at", desc=True)\
-        .limit(10)\
-        .execute().data
+    history = await db.list_history(int(p_id), limit=10)
     
     project_name_escaped = escape(str(project['name']))
     text = f"<b>📊 ИСТОРИЯ ИЗМЕНЕНИЙ</b>\n<b>{project_name_escaped}</b>\n⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯\n\n"
@@ -2095,51 +2171,27 @@ async def handle_like(call: CallbackQuery):
     p_id = call.data.split("_")[1]
     
     # Проверяем, не забанен ли пользователь
-    ban_result = supabase.table("banned_users")\
-        .select("*")\
-        .eq("user_id", call.from_user.id)\
-        .execute()
-    
-    if ban_result.data:
+    if call.from_user.id in ban_index:
         await call.answer("🚫 Вы заблокированы и не можете ставить лайки!", show_alert=True)
         return
     
-    check = supabase.table("user_logs").select("id").eq("user_id", call.from_user.id).eq("project_id", p_id).eq("action_type", "like").execute()
-    if check.data: 
-        await call.answer("Вы уже поддержали этот проект!", show_alert=True)
+    # Лайк, рейтинг и история пишутся одной транзакцией на стороне базы
+    result = await db.add_like(int(p_id), call.from_user.id, call.from_user.username)
+    if not result:
+        await call.answer("Проект не найден.", show_alert=True)
         return
     
-    # Получаем текущий рейтинг
-    project = await find_project_by_id(int(p_id))
-    if not project:
-        await call.answer("Проект не найден.", show_alert=True)
+    if not result['liked']: 
+        await call.answer("Вы уже поддержали этот проект!", show_alert=True)
         return
     
-    old_score = project['score']
-    new_score = old_score + 1
-    
-    # Обновляем рейтинг проекта
-    supabase.table("projects").update({"score": new_score}).eq("id", p_id).execute()
-    
-    # Добавляем лайк в логи
-    supabase.table("user_logs").insert({
-        "user_id": call.from_user.id, 
-        "project_id": p_id, 
-        "action_type": "like"
-    }).execute()
-    
-    # Добавляем запись в историю
-    supabase.table("rating_history").insert({
-        "project_id": p_id,
-        "user_id": call.from_user.id,
-        "username": call.from_user.username,
-        "change_type": "like",
-        "score_before": old_score,
-        "score_after": new_score,
-        "change_amount": 1,
-        "reason": "Лайк от пользователя",
-        "is_admin_action": False
-    }).execute()
+    weekly_top_engine.record(
+        {"id": result['project_id'], "name": result['project_name'],
+         "category": result['category'], "score": result['score_after']},
+        result['change_amount']
+    )
+    search_index.set_score(result['project_id'], result['score_after'])
+    leaderboard.mark_dirty()
     
     # Обновляем панель с новым рейтингом
     await open_panel(call)
@@ -2152,19 +2204,12 @@ async def show_my_review(call: CallbackQuery):
     user_id = call.from_user.id
     
     # Ищем отзыв пользователя
-    review = supabase.table("user_logs")\
-        .select("*")\
-        .eq("user_id", user_id)\
-        .eq("project_id", p_id)\
-        .eq("action_type", "review")\
-        .single()\
-        .execute()
-    
-    if not review.data:
+    review_data = await db.get_user_action(user_id, int(p_id), "review")
+    
+    if not review_data:
         await call.answer("У вас еще нет отзыва об этом проекте", show_alert=True)
         return
     
-    review_data = review.data
     project = await find_project_by_id(int(p_id))
     
     project_name_escaped = escape(str(project['name'])) if project else "Проект"
@@ -2200,12 +2245,212 @@ async def close_panel(call: CallbackQuery):
     await call.answer("Панель закрыта")
 
 # --- ЗАПУСК БОТА ---
-async def main():
-    logging.basicConfig(level=logging.INFO)
+def setup_dispatcher():
     dp.update.outer_middleware(AccessMiddleware())
     dp.include_router(router)
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+
+
+async def start_services(primary: bool = True):
+    """Загрузка индексов и запуск фоновых задач (общая для обоих режимов)
+
+    primary — процесс, который ведет общие для всех задачи: очистку удаленных
+    проектов и первую публикацию рейтинга (один процесс или воркер 0).
+    """
+    await db.init_db(SUPABASE_URL, SUPABASE_KEY)
+    try:
+        banned_count = await ban_index.load()
+        logging.info(f"Бан-лист загружен: {banned_count} пользователей")
+    except Exception as e:
+        logging.error(f"Ошибка загрузки бан-листа: {e}")
+    asyncio.create_task(ban_index.refresh_forever(BAN_REFRESH_INTERVAL))
+    try:
+        history_count = await weekly_top_engine.load()
+        logging.info(f"Топ недели построен по {history_count} изменениям")
+    except Exception as e:
+        logging.error(f"Ошибка загрузки топа недели: {e}")
+    try:
+        indexed_count = await search_index.load()
+        logging.info(f"Поисковый индекс построен: {indexed_count} проектов")
+    except Exception as e:
+        logging.error(f"Ошибка построения поискового индекса: {e}")
+    if WORKERS <= 1:
+        # Воркеры перестраивают индекс в sync_worker_caches
+        asyncio.create_task(search_index.refresh_forever(SEARCH_INDEX_REFRESH_INTERVAL))
+    if primary:
+        asyncio.create_task(purge_deleted_projects_forever())
+        leaderboard.mark_dirty()  # Первая публикация статического рейтинга
+    await log_dispatcher.start()
+
+
+async def run_polling():
+    await bot.delete_webhook(drop_pending_updates=DROP_PENDING_UPDATES)
+    # chat_member приходит только если запросить его явно
+    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+
+
+def _stop_event():
+    """Event, который выставляется по SIGINT/SIGTERM"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    return stop_event
+
+
+async def set_webhook():
+    if not WEBHOOK_URL or not WEBHOOK_SECRET:
+        raise RuntimeError("Для BOT_MODE=webhook нужны WEBHOOK_URL и WEBHOOK_SECRET")
+    await bot.set_webhook(
+        WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        drop_pending_updates=DROP_PENDING_UPDATES
+    )
+
+
+async def serve_app(app: web.Application, stop_event: asyncio.Event):
+    """Запускает aiohttp-приложение, ставит вебхук и работает до stop_event"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    logging.info(f"Webhook-сервер слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    try:
+        # Сервер уже принимает запросы, поэтому накопленные апдейты не теряются
+        await set_webhook()
+        await stop_event.wait()
+    finally:
+        # Вебхук не удаляем: пока бот перезапускается, Telegram копит апдейты.
+        # cleanup дожидается запросов, которые уже обрабатываются.
+        logging.info("Остановка webhook-сервера")
+        await runner.cleanup()
+
+
+async def run_webhook():
+    """aiohttp-сервер, принимающий апдейты от Telegram.
+    
+    Апдейт подтверждается (HTTP 200) только после обработки, поэтому при
+    падении или перезапуске Telegram доставит его повторно. Параллельность
+    задается WEBHOOK_MAX_CONNECTIONS: aiohttp обрабатывает запросы конкурентно.
+    Локальная проверка:
+        curl -X POST localhost:8080/webhook -H "Content-Type: application/json" \\
+             -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" -d @update.json
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=False
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    await serve_app(app, _stop_event())
+
+
+# --- НЕСКОЛЬКО ВОРКЕРОВ ---
+def worker_env(index: int) -> dict:
+    """Окружение воркера: свои SQLite-файлы и доля лимита логов"""
+    outbox_base, outbox_ext = os.path.splitext(LOG_OUTBOX_PATH)
+    fsm_base, fsm_ext = os.path.splitext(FSM_SQLITE_PATH)
+    return {
+        "LOG_OUTBOX_PATH": f"{outbox_base}.{index}{outbox_ext}",
+        "FSM_SQLITE_PATH": f"{fsm_base}.{index}{fsm_ext}",
+        "LOG_RATE_PER_MINUTE": str(max(1, LOG_RATE_PER_MINUTE // WORKERS)),
+    }
+
+
+async def purge_deleted_projects_forever():
+    """Фоновая очистка: отзывы и история больших удаленных проектов пачками"""
+    while True:
+        try:
+            while await db.purge_deleted_projects(PURGE_BATCH_SIZE):
+                # Между пачками отдаем базу запросам пользователей
+                await asyncio.sleep(0.1)
+        except Exception as e:
+            logging.error(f"Ошибка очистки удаленных проектов: {e}")
+        await asyncio.sleep(PURGE_INTERVAL)
+
+
+async def sync_worker_caches():
+    """Изменения из других воркеров: топ недели и поиск перечитываются, фото сбрасываются"""
+    while True:
+        await asyncio.sleep(WORKER_SYNC_INTERVAL)
+        try:
+            await weekly_top_engine.load()
+            await search_index.load()
+            photo_cache.invalidate()
+        except Exception as e:
+            logging.error(f"Ошибка синхронизации кэшей воркера: {e}")
+
+
+def apply_worker_control(message: dict):
+    """Служебное сообщение от другого воркера (см. set_ban)"""
+    if "ban" in message:
+        ban = message["ban"]
+        if ban["ban"]:
+            ban_index.add(ban["ban"])
+        else:
+            ban_index.remove(ban["user_id"])
+
+
+async def serve_worker(index: int, queue):
+    """Точка входа процесса-воркера"""
+    logging.basicConfig(level=logging.INFO, format=f"[worker {index}] %(levelname)s:%(name)s:%(message)s")
+    setup_dispatcher()
+    await start_services(primary=index == 0)
+    asyncio.create_task(sync_worker_caches())
+    await dp.emit_startup(bot=bot)
+    try:
+        await consume_updates(dp, bot, queue, on_control=apply_worker_control)
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        await log_dispatcher.stop()
+        await storage.close()
+        await bot.session.close()
+
+
+async def run_workers():
+    """Приемник апдейтов: раздает их воркерам по user_id"""
+    pool = WorkerPool(serve_worker, WORKERS, worker_env=worker_env)
+    pool.start()
+    stop_event = _stop_event()
+    try:
+        if BOT_MODE == "webhook":
+            async def ingest(request: web.Request):
+                secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+                if not hmac.compare_digest(secret, WEBHOOK_SECRET):
+                    return web.Response(status=401)
+                pool.dispatch(await request.json())
+                return web.Response()
+
+            app = web.Application()
+            app.router.add_post(WEBHOOK_PATH, ingest)
+            await serve_app(app, stop_event)
+        else:
+            await bot.delete_webhook(drop_pending_updates=DROP_PENDING_UPDATES)
+            await poll_updates(bot, pool, dp.resolve_used_update_types(), stop_event)
+    finally:
+        await pool.stop()
+        await bot.session.close()
+
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    setup_dispatcher()
+    if WORKERS > 1:
+        # Хендлеры и сервисы работают в воркерах, приемнику база не нужна
+        await run_workers()
+        return
+    await start_services()
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook()
+        else:
+            await run_polling()
+    finally:
+        # Неотправленные логи остаются в outbox и уйдут после перезапуска
+        await log_dispatcher.stop()
+        await storage.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
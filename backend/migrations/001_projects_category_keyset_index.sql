@@ -0,0 +1,4 @@
+-- Индекс под keyset-пагинацию категорий:
+-- WHERE category = ? AND (score, id) после курсора ORDER BY score DESC, id ASC
+CREATE INDEX IF NOT EXISTS projects_category_score_id_idx
+    ON projects (category, score DESC, id);
@@ -0,0 +1,276 @@
+-- Атомарные изменения рейтинга.
+-- Каждая функция в одной транзакции блокирует строку проекта, применяет
+-- изменение score, пишет отзыв/лайк и запись в rating_history и возвращает
+-- score_before / score_after. Бот вызывает их одним supabase.rpc(...).
+
+-- Баллы за оценку (единственное место, где они заданы)
+CREATE OR REPLACE FUNCTION rating_delta(p_rating int)
+RETURNS int
+LANGUAGE sql IMMUTABLE
+AS $$
+    SELECT CASE p_rating
+        WHEN 1 THEN -5
+        WHEN 2 THEN -2
+        WHEN 3 THEN 0
+        WHEN 4 THEN 2
+        WHEN 5 THEN 5
+        ELSE 0
+    END;
+$$;
+
+
+-- Новый или измененный отзыв пользователя
+CREATE OR REPLACE FUNCTION submit_review(
+    p_project_id bigint,
+    p_user_id bigint,
+    p_username text,
+    p_review_text text,
+    p_rating int
+)
+RETURNS TABLE (
+    log_id bigint,
+    is_update boolean,
+    old_rating int,
+    project_id bigint,
+    project_name text,
+    category text,
+    score_before int,
+    score_after int,
+    change_amount int
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_project projects%ROWTYPE;
+    v_old user_logs%ROWTYPE;
+    v_change int;
+    v_reason text;
+BEGIN
+    SELECT * INTO v_project FROM projects WHERE id = p_project_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    SELECT * INTO v_old FROM user_logs
+    WHERE user_logs.user_id = p_user_id
+      AND user_logs.project_id = p_project_id
+      AND action_type = 'review'
+    ORDER BY id
+    LIMIT 1;
+
+    IF FOUND THEN
+        v_change := rating_delta(p_rating) - rating_delta(v_old.rating_val);
+        UPDATE user_logs SET review_text = p_review_text, rating_val = p_rating
+        WHERE id = v_old.id;
+        log_id := v_old.id;
+        is_update := true;
+        old_rating := v_old.rating_val;
+        v_reason := format('Изменение отзыва: %s/5 → %s/5', v_old.rating_val, p_rating);
+    ELSE
+        v_change := rating_delta(p_rating);
+        INSERT INTO user_logs (user_id, project_id, action_type, review_text, rating_val)
+        VALUES (p_user_id, p_project_id, 'review', p_review_text, p_rating)
+        RETURNING id INTO log_id;
+        is_update := false;
+        v_reason := format('Новый отзыв: %s/5', p_rating);
+    END IF;
+
+    UPDATE projects SET score = score + v_change WHERE id = p_project_id;
+
+    INSERT INTO rating_history (
+        project_id, user_id, username, change_type, score_before, score_after,
+        change_amount, reason, is_admin_action, related_review_id
+    ) VALUES (
+        p_project_id, p_user_id, p_username, 'user_review', v_project.score, v_project.score + v_change,
+        v_change, v_reason, false, log_id
+    );
+
+    project_id := v_project.id;
+    project_name := v_project.name;
+    category := v_project.category;
+    score_before := v_project.score;
+    score_after := v_project.score + v_change;
+    change_amount := v_change;
+    RETURN NEXT;
+END;
+$$;
+
+
+-- Лайк: liked = false, если пользователь уже поддержал проект
+CREATE OR REPLACE FUNCTION add_like(
+    p_project_id bigint,
+    p_user_id bigint,
+    p_username text
+)
+RETURNS TABLE (
+    liked boolean,
+    project_id bigint,
+    project_name text,
+    category text,
+    score_before int,
+    score_after int,
+    change_amount int
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_project projects%ROWTYPE;
+BEGIN
+    SELECT * INTO v_project FROM projects WHERE id = p_project_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    project_id := v_project.id;
+    project_name := v_project.name;
+    category := v_project.category;
+    score_before := v_project.score;
+
+    IF EXISTS (
+        SELECT 1 FROM user_logs
+        WHERE user_logs.user_id = p_user_id
+          AND user_logs.project_id = p_project_id
+          AND action_type = 'like'
+    ) THEN
+        liked := false;
+        score_after := v_project.score;
+        change_amount := 0;
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    INSERT INTO user_logs (user_id, project_id, action_type)
+    VALUES (p_user_id, p_project_id, 'like');
+
+    UPDATE projects SET score = score + 1 WHERE id = p_project_id;
+
+    INSERT INTO rating_history (
+        project_id, user_id, username, change_type, score_before, score_after,
+        change_amount, reason, is_admin_action
+    ) VALUES (
+        p_project_id, p_user_id, p_username, 'like', v_project.score, v_project.score + 1,
+        1, 'Лайк от пользователя', false
+    );
+
+    liked := true;
+    score_after := v_project.score + 1;
+    change_amount := 1;
+    RETURN NEXT;
+END;
+$$;
+
+
+-- Ручное изменение рейтинга админом
+CREATE OR REPLACE FUNCTION admin_change_score(
+    p_project_id bigint,
+    p_admin_id bigint,
+    p_admin_username text,
+    p_amount int,
+    p_reason text
+)
+RETURNS TABLE (
+    project_id bigint,
+    project_name text,
+    category text,
+    score_before int,
+    score_after int,
+    change_amount int
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_project projects%ROWTYPE;
+BEGIN
+    SELECT * INTO v_project FROM projects WHERE id = p_project_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    UPDATE projects SET score = score + p_amount WHERE id = p_project_id;
+
+    INSERT INTO rating_history (
+        project_id, admin_id, admin_username, change_type, score_before, score_after,
+        change_amount, reason, is_admin_action
+    ) VALUES (
+        p_project_id, p_admin_id, p_admin_username, 'admin_change', v_project.score, v_project.score + p_amount,
+        p_amount, p_reason, true
+    );
+
+    project_id := v_project.id;
+    project_name := v_project.name;
+    category := v_project.category;
+    score_before := v_project.score;
+    score_after := v_project.score + p_amount;
+    change_amount := p_amount;
+    RETURN NEXT;
+END;
+$$;
+
+
+-- Удаление отзыва админом с откатом его влияния на рейтинг
+CREATE OR REPLACE FUNCTION delete_review(
+    p_log_id bigint,
+    p_admin_id bigint,
+    p_admin_username text
+)
+RETURNS TABLE (
+    project_id bigint,
+    project_name text,
+    category text,
+    rating_val int,
+    review_text text,
+    score_before int,
+    score_after int,
+    change_amount int
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_log user_logs%ROWTYPE;
+    v_project projects%ROWTYPE;
+    v_change int;
+BEGIN
+    SELECT * INTO v_log FROM user_logs WHERE id = p_log_id;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    SELECT * INTO v_project FROM projects WHERE id = v_log.project_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    -- Повторно читаем отзыв под блокировкой проекта: его могли удалить параллельно
+    SELECT * INTO v_log FROM user_logs WHERE id = p_log_id;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    v_change := -rating_delta(v_log.rating_val);
+
+    INSERT INTO rating_history (
+        project_id, admin_id, admin_username, change_type, score_before, score_after,
+        change_amount, reason, is_admin_action, related_review_id
+    ) VALUES (
+        v_project.id, p_admin_id, p_admin_username, 'delete_review', v_project.score, v_project.score + v_change,
+        v_change, format('Удаление отзыва #%s (оценка: %s/5)', p_log_id, v_log.rating_val), true, p_log_id
+    );
+
+    UPDATE projects SET score = score + v_change WHERE id = v_project.id;
+    DELETE FROM user_logs WHERE id = p_log_id;
+
+    project_id := v_project.id;
+    project_name := v_project.name;
+    category := v_project.category;
+    rating_val := v_log.rating_val;
+    review_text := v_log.review_text;
+    score_before := v_project.score;
+    score_after := v_project.score + v_change;
+    change_amount := v_change;
+    RETURN NEXT;
+END;
+$$;
@@ -0,0 +1,37 @@
+-- Статистика проекта для /stats одной строкой вместо выгрузки всех отзывов,
+-- лайков и истории. Считается на стороне базы по индексам ниже.
+
+CREATE INDEX IF NOT EXISTS user_logs_project_action_idx
+    ON user_logs (project_id, action_type);
+
+CREATE INDEX IF NOT EXISTS rating_history_project_idx
+    ON rating_history (project_id);
+
+
+CREATE OR REPLACE FUNCTION project_stats(p_project_id bigint)
+RETURNS TABLE (
+    reviews_count bigint,
+    likes_count bigint,
+    avg_rating numeric,
+    rating_1 bigint,
+    rating_2 bigint,
+    rating_3 bigint,
+    rating_4 bigint,
+    rating_5 bigint,
+    history_count bigint
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT
+        count(*) FILTER (WHERE l.action_type = 'review'),
+        count(*) FILTER (WHERE l.action_type = 'like'),
+        coalesce(avg(l.rating_val) FILTER (WHERE l.action_type = 'review'), 0),
+        count(*) FILTER (WHERE l.action_type = 'review' AND l.rating_val = 1),
+        count(*) FILTER (WHERE l.action_type = 'review' AND l.rating_val = 2),
+        count(*) FILTER (WHERE l.action_type = 'review' AND l.rating_val = 3),
+        count(*) FILTER (WHERE l.action_type = 'review' AND l.rating_val = 4),
+        count(*) FILTER (WHERE l.action_type = 'review' AND l.rating_val = 5),
+        (SELECT count(*) FROM rating_history h WHERE h.project_id = p_project_id)
+    FROM user_logs l
+    WHERE l.project_id = p_project_id;
+$$;
@@ -0,0 +1,152 @@
+-- Денормализованные счетчики проекта: отзывы, лайки, сумма оценок и
+-- распределение 1-5. Обновляются триггером на user_logs в той же транзакции,
+-- что и сама запись (submit_review, add_like, delete_review, удаление проекта),
+-- поэтому читать их можно одним запросом по первичному ключу.
+-- reconcile_project_counters() пересобирает таблицу из user_logs целиком.
+
+CREATE TABLE IF NOT EXISTS project_counters (
+    project_id bigint PRIMARY KEY REFERENCES projects (id) ON DELETE CASCADE,
+    review_count int NOT NULL DEFAULT 0,
+    like_count int NOT NULL DEFAULT 0,
+    rating_sum int NOT NULL DEFAULT 0,
+    rating_1 int NOT NULL DEFAULT 0,
+    rating_2 int NOT NULL DEFAULT 0,
+    rating_3 int NOT NULL DEFAULT 0,
+    rating_4 int NOT NULL DEFAULT 0,
+    rating_5 int NOT NULL DEFAULT 0,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+
+-- Прибавляет (p_sign = 1) или вычитает (p_sign = -1) одну запись user_logs
+CREATE OR REPLACE FUNCTION project_counters_apply(
+    p_project_id bigint,
+    p_action text,
+    p_rating int,
+    p_sign int
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_review int := CASE WHEN p_action = 'review' THEN p_sign ELSE 0 END;
+    v_like int := CASE WHEN p_action = 'like' THEN p_sign ELSE 0 END;
+BEGIN
+    IF v_review = 0 AND v_like = 0 THEN
+        RETURN;
+    END IF;
+
+    -- Строка счетчиков появляется с первым отзывом или лайком
+    -- (у удаленного проекта ее уже нет, и создавать ее не нужно)
+    IF p_sign > 0 THEN
+        INSERT INTO project_counters (project_id)
+        SELECT p_project_id WHERE EXISTS (SELECT 1 FROM projects WHERE id = p_project_id)
+        ON CONFLICT (project_id) DO NOTHING;
+    END IF;
+
+    UPDATE project_counters SET
+        review_count = review_count + v_review,
+        like_count = like_count + v_like,
+        rating_sum = rating_sum + v_review * coalesce(p_rating, 0),
+        rating_1 = rating_1 + CASE WHEN p_rating = 1 THEN v_review ELSE 0 END,
+        rating_2 = rating_2 + CASE WHEN p_rating = 2 THEN v_review ELSE 0 END,
+        rating_3 = rating_3 + CASE WHEN p_rating = 3 THEN v_review ELSE 0 END,
+        rating_4 = rating_4 + CASE WHEN p_rating = 4 THEN v_review ELSE 0 END,
+        rating_5 = rating_5 + CASE WHEN p_rating = 5 THEN v_review ELSE 0 END,
+        updated_at = now()
+    WHERE project_id = p_project_id;
+END;
+$$;
+
+
+CREATE OR REPLACE FUNCTION user_logs_counters_trigger()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- UPDATE (изменение отзыва) = вычесть старую запись и прибавить новую
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM project_counters_apply(OLD.project_id, OLD.action_type, OLD.rating_val, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM project_counters_apply(NEW.project_id, NEW.action_type, NEW.rating_val, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS user_logs_counters ON user_logs;
+CREATE TRIGGER user_logs_counters
+    AFTER INSERT OR UPDATE OR DELETE ON user_logs
+    FOR EACH ROW EXECUTE FUNCTION user_logs_counters_trigger();
+
+
+-- Полная пересборка счетчиков из user_logs; возвращает число проектов со счетчиками
+CREATE OR REPLACE FUNCTION reconcile_project_counters()
+RETURNS bigint
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_count bigint;
+BEGIN
+    -- Запись отзывов ждет окончания пересборки, чтобы счетчики не разошлись
+    LOCK TABLE user_logs IN SHARE MODE;
+
+    DELETE FROM project_counters;
+
+    INSERT INTO project_counters (
+        project_id, review_count, like_count, rating_sum,
+        rating_1, rating_2, rating_3, rating_4, rating_5
+    )
+    SELECT
+        l.project_id,
+        count(*) FILTER (WHERE l.action_type = 'review'),
+        count(*) FILTER (WHERE l.action_type = 'like'),
+        coalesce(sum(l.rating_val) FILTER (WHERE l.action_type = 'review'), 0),
+        count(*) FILTER (WHERE l.action_type = 'review' AND l.rating_val = 1),
+        count(*) FILTER (WHERE l.action_type = 'review' AND l.rating_val = 2),
+        count(*) FILTER (WHERE l.action_type = 'review' AND l.rating_val = 3),
+        count(*) FILTER (WHERE l.action_type = 'review' AND l.rating_val = 4),
+        count(*) FILTER (WHERE l.action_type = 'review' AND l.rating_val = 5)
+    FROM user_logs l
+    JOIN projects p ON p.id = l.project_id
+    WHERE l.action_type IN ('review', 'like')
+    GROUP BY l.project_id;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$;
+
+
+-- /stats теперь читает счетчики вместо подсчета по user_logs
+CREATE OR REPLACE FUNCTION project_stats(p_project_id bigint)
+RETURNS TABLE (
+    reviews_count bigint,
+    likes_count bigint,
+    avg_rating numeric,
+    rating_1 bigint,
+    rating_2 bigint,
+    rating_3 bigint,
+    rating_4 bigint,
+    rating_5 bigint,
+    history_count bigint
+)
+LANGUAGE sql STABLE
+AS $$
+    SELECT
+        coalesce(c.review_count, 0),
+        coalesce(c.like_count, 0),
+        CASE WHEN c.review_count > 0 THEN c.rating_sum::numeric / c.review_count ELSE 0 END,
+        coalesce(c.rating_1, 0),
+        coalesce(c.rating_2, 0),
+        coalesce(c.rating_3, 0),
+        coalesce(c.rating_4, 0),
+        coalesce(c.rating_5, 0),
+        (SELECT count(*) FROM rating_history h WHERE h.project_id = p_project_id)
+    FROM (SELECT p_project_id AS project_id) q
+    LEFT JOIN project_counters c ON c.project_id = q.project_id;
+$$;
+
+-- Начальное заполнение
+SELECT reconcile_project_counters();
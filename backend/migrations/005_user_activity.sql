@@ -0,0 +1,84 @@
+-- Активность пользователя для /finduser одним запросом по индексам:
+-- отзывы, лайки, последняя активность, затронутые проекты и бан.
+-- Пользователя можно искать по ID или по username из rating_history.
+
+CREATE INDEX IF NOT EXISTS user_logs_user_idx
+    ON user_logs (user_id);
+
+CREATE INDEX IF NOT EXISTS rating_history_user_created_idx
+    ON rating_history (user_id, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS rating_history_username_created_idx
+    ON rating_history (lower(username), created_at DESC);
+
+
+CREATE OR REPLACE FUNCTION find_user_activity(
+    p_user_id bigint DEFAULT NULL,
+    p_username text DEFAULT NULL
+)
+RETURNS TABLE (
+    user_id bigint,
+    username text,
+    reviews_count bigint,
+    likes_count bigint,
+    last_activity_at timestamptz,
+    projects_count bigint,
+    projects jsonb,
+    is_banned boolean,
+    ban_reason text,
+    banned_at timestamptz,
+    banned_by_username text
+)
+LANGUAGE plpgsql STABLE
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_user_id bigint := p_user_id;
+    v_username text;
+BEGIN
+    IF v_user_id IS NULL THEN
+        SELECT h.user_id, h.username INTO v_user_id, v_username
+        FROM rating_history h
+        WHERE lower(h.username) = lower(ltrim(p_username, '@'))
+          AND h.user_id IS NOT NULL
+        ORDER BY h.created_at DESC
+        LIMIT 1;
+        IF v_user_id IS NULL THEN
+            RETURN;
+        END IF;
+    ELSE
+        SELECT h.username INTO v_username
+        FROM rating_history h
+        WHERE h.user_id = v_user_id AND h.username IS NOT NULL
+        ORDER BY h.created_at DESC
+        LIMIT 1;
+    END IF;
+
+    RETURN QUERY
+    SELECT
+        v_user_id,
+        v_username,
+        count(*) FILTER (WHERE l.action_type = 'review'),
+        count(*) FILTER (WHERE l.action_type = 'like'),
+        (SELECT max(h.created_at) FROM rating_history h WHERE h.user_id = v_user_id),
+        count(DISTINCT l.project_id),
+        (
+            SELECT coalesce(jsonb_agg(jsonb_build_object('id', p.id, 'name', p.name) ORDER BY p.score DESC), '[]'::jsonb)
+            FROM (
+                SELECT p.id, p.name, p.score
+                FROM projects p
+                WHERE p.id IN (SELECT ul.project_id FROM user_logs ul WHERE ul.user_id = v_user_id)
+                ORDER BY p.score DESC
+                LIMIT 10
+            ) p
+        ),
+        b.user_id IS NOT NULL,
+        b.reason,
+        b.banned_at::timestamptz,
+        b.banned_by_username
+    FROM (SELECT v_user_id AS user_id) u
+    LEFT JOIN user_logs l ON l.user_id = u.user_id
+    LEFT JOIN banned_users b ON b.user_id = u.user_id
+    GROUP BY b.user_id, b.reason, b.banned_at, b.banned_by_username;
+END;
+$$;
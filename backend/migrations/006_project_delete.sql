@@ -0,0 +1,496 @@
+-- Удаление проекта одной транзакцией (/del).
+-- delete_project() блокирует проект, сохраняет его копию в deleted_projects
+-- и возвращает число удаленных отзывов из project_counters. Небольшой
+-- проект удаляется сразу вместе с отзывами и историей; у большого только
+-- ставится deleted_at, а строки user_logs и rating_history пачками удаляет
+-- фоновая очистка purge_deleted_projects(). Бот не показывает проекты
+-- с deleted_at, а изменить их рейтинг нельзя.
+
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS deleted_at timestamptz;
+
+CREATE INDEX IF NOT EXISTS projects_deleted_idx
+    ON projects (deleted_at, id)
+    WHERE deleted_at IS NOT NULL;
+
+-- Копии удаленных проектов (вместо записи 'delete' в rating_history,
+-- которая удалялась вместе с остальной историей проекта)
+CREATE TABLE IF NOT EXISTS deleted_projects (
+    id bigserial PRIMARY KEY,
+    project_id bigint NOT NULL,
+    project jsonb NOT NULL,
+    reviews_count int NOT NULL DEFAULT 0,
+    deleted_by bigint,
+    deleted_by_username text,
+    deleted_at timestamptz NOT NULL DEFAULT now()
+);
+
+
+-- Удаленный проект только ждет очистки: отзывы, лайки и /score
+-- (все они меняют score) откатываются с ошибкой
+CREATE OR REPLACE FUNCTION projects_deleted_guard()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RAISE EXCEPTION 'project % is deleted', OLD.id;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS projects_deleted_guard ON projects;
+CREATE TRIGGER projects_deleted_guard
+    BEFORE UPDATE ON projects
+    FOR EACH ROW
+    WHEN (OLD.deleted_at IS NOT NULL)
+    EXECUTE FUNCTION projects_deleted_guard();
+
+
+CREATE OR REPLACE FUNCTION delete_project(
+    p_project_id bigint,
+    p_admin_id bigint,
+    p_admin_username text,
+    p_inline_limit int DEFAULT 1000
+)
+RETURNS TABLE (
+    project_id bigint,
+    project_name text,
+    category text,
+    score int,
+    reviews_count int,
+    purged boolean
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_project projects%ROWTYPE;
+    v_reviews int;
+    v_rows bigint;
+BEGIN
+    SELECT * INTO v_project FROM projects
+    WHERE id = p_project_id AND deleted_at IS NULL
+    FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    SELECT coalesce(max(c.review_count), 0) INTO v_reviews
+    FROM project_counters c
+    WHERE c.project_id = p_project_id;
+
+    INSERT INTO deleted_projects (project_id, project, reviews_count, deleted_by, deleted_by_username)
+    VALUES (p_project_id, to_jsonb(v_project), v_reviews, p_admin_id, p_admin_username);
+
+    DELETE FROM project_photos WHERE project_photos.project_id = p_project_id;
+    -- Без строки счетчиков триггер user_logs при удалении отзывов ничего не пересчитывает
+    DELETE FROM project_counters WHERE project_counters.project_id = p_project_id;
+
+    -- Считаем строки не дальше лимита, чтобы не сканировать большой проект целиком
+    SELECT
+        (SELECT count(*) FROM (
+            SELECT 1 FROM user_logs l WHERE l.project_id = p_project_id LIMIT p_inline_limit + 1
+        ) s)
+        + (SELECT count(*) FROM (
+            SELECT 1 FROM rating_history h WHERE h.project_id = p_project_id LIMIT p_inline_limit + 1
+        ) s)
+    INTO v_rows;
+
+    IF v_rows <= p_inline_limit THEN
+        DELETE FROM user_logs WHERE user_logs.project_id = p_project_id;
+        DELETE FROM rating_history WHERE rating_history.project_id = p_project_id;
+        DELETE FROM projects WHERE id = p_project_id;
+    ELSE
+        UPDATE projects SET deleted_at = now() WHERE id = p_project_id;
+    END IF;
+
+    RETURN QUERY SELECT
+        v_project.id,
+        v_project.name,
+        v_project.category,
+        v_project.score,
+        v_reviews,
+        v_rows <= p_inline_limit;
+END;
+$$;
+
+
+-- Один шаг фоновой очистки: до p_batch строк самого старого удаленного проекта.
+-- Когда отзывов и истории не осталось, удаляется и сам проект.
+-- Возвращает число удаленных строк (0 — очищать нечего).
+CREATE OR REPLACE FUNCTION purge_deleted_projects(p_batch int DEFAULT 1000)
+RETURNS bigint
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_project_id bigint;
+    v_deleted bigint;
+    v_count bigint := 0;
+BEGIN
+    -- Несколько воркеров могут чистить одновременно, каждый свой проект
+    SELECT id INTO v_project_id FROM projects
+    WHERE deleted_at IS NOT NULL
+    ORDER BY deleted_at, id
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED;
+    IF NOT FOUND THEN
+        RETURN 0;
+    END IF;
+
+    DELETE FROM user_logs WHERE ctid = ANY (ARRAY(
+        SELECT ctid FROM user_logs WHERE project_id = v_project_id LIMIT p_batch
+    ));
+    GET DIAGNOSTICS v_deleted = ROW_COUNT;
+    v_count := v_deleted;
+
+    IF v_count < p_batch THEN
+        DELETE FROM rating_history WHERE ctid = ANY (ARRAY(
+            SELECT ctid FROM rating_history WHERE project_id = v_project_id LIMIT p_batch - v_count
+        ));
+        GET DIAGNOSTICS v_deleted = ROW_COUNT;
+        v_count := v_count + v_deleted;
+    END IF;
+
+    IF v_count < p_batch THEN
+        DELETE FROM projects WHERE id = v_project_id;
+        v_count := v_count + 1;
+    END IF;
+
+    RETURN v_count;
+END;
+$$;
+
+
+-- Функции из 002 заново, с условием deleted_at IS NULL: для удаленного
+-- проекта они ничего не возвращают (бот отвечает «проект не найден»),
+-- а не падают на projects_deleted_guard.
+
+-- Новый или измененный отзыв пользователя
+CREATE OR REPLACE FUNCTION submit_review(
+    p_project_id bigint,
+    p_user_id bigint,
+    p_username text,
+    p_review_text text,
+    p_rating int
+)
+RETURNS TABLE (
+    log_id bigint,
+    is_update boolean,
+    old_rating int,
+    project_id bigint,
+    project_name text,
+    category text,
+    score_before int,
+    score_after int,
+    change_amount int
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_project projects%ROWTYPE;
+    v_old user_logs%ROWTYPE;
+    v_change int;
+    v_reason text;
+BEGIN
+    SELECT * INTO v_project FROM projects WHERE id = p_project_id AND deleted_at IS NULL FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    SELECT * INTO v_old FROM user_logs
+    WHERE user_logs.user_id = p_user_id
+      AND user_logs.project_id = p_project_id
+      AND action_type = 'review'
+    ORDER BY id
+    LIMIT 1;
+
+    IF FOUND THEN
+        v_change := rating_delta(p_rating) - rating_delta(v_old.rating_val);
+        UPDATE user_logs SET review_text = p_review_text, rating_val = p_rating
+        WHERE id = v_old.id;
+        log_id := v_old.id;
+        is_update := true;
+        old_rating := v_old.rating_val;
+        v_reason := format('Изменение отзыва: %s/5 → %s/5', v_old.rating_val, p_rating);
+    ELSE
+        v_change := rating_delta(p_rating);
+        INSERT INTO user_logs (user_id, project_id, action_type, review_text, rating_val)
+        VALUES (p_user_id, p_project_id, 'review', p_review_text, p_rating)
+        RETURNING id INTO log_id;
+        is_update := false;
+        v_reason := format('Новый отзыв: %s/5', p_rating);
+    END IF;
+
+    UPDATE projects SET score = score + v_change WHERE id = p_project_id;
+
+    INSERT INTO rating_history (
+        project_id, user_id, username, change_type, score_before, score_after,
+        change_amount, reason, is_admin_action, related_review_id
+    ) VALUES (
+        p_project_id, p_user_id, p_username, 'user_review', v_project.score, v_project.score + v_change,
+        v_change, v_reason, false, log_id
+    );
+
+    project_id := v_project.id;
+    project_name := v_project.name;
+    category := v_project.category;
+    score_before := v_project.score;
+    score_after := v_project.score + v_change;
+    change_amount := v_change;
+    RETURN NEXT;
+END;
+$$;
+
+
+-- Лайк: liked = false, если пользователь уже поддержал проект
+CREATE OR REPLACE FUNCTION add_like(
+    p_project_id bigint,
+    p_user_id bigint,
+    p_username text
+)
+RETURNS TABLE (
+    liked boolean,
+    project_id bigint,
+    project_name text,
+    category text,
+    score_before int,
+    score_after int,
+    change_amount int
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_project projects%ROWTYPE;
+BEGIN
+    SELECT * INTO v_project FROM projects WHERE id = p_project_id AND deleted_at IS NULL FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    project_id := v_project.id;
+    project_name := v_project.name;
+    category := v_project.category;
+    score_before := v_project.score;
+
+    IF EXISTS (
+        SELECT 1 FROM user_logs
+        WHERE user_logs.user_id = p_user_id
+          AND user_logs.project_id = p_project_id
+          AND action_type = 'like'
+    ) THEN
+        liked := false;
+        score_after := v_project.score;
+        change_amount := 0;
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    INSERT INTO user_logs (user_id, project_id, action_type)
+    VALUES (p_user_id, p_project_id, 'like');
+
+    UPDATE projects SET score = score + 1 WHERE id = p_project_id;
+
+    INSERT INTO rating_history (
+        project_id, user_id, username, change_type, score_before, score_after,
+        change_amount, reason, is_admin_action
+    ) VALUES (
+        p_project_id, p_user_id, p_username, 'like', v_project.score, v_project.score + 1,
+        1, 'Лайк от пользователя', false
+    );
+
+    liked := true;
+    score_after := v_project.score + 1;
+    change_amount := 1;
+    RETURN NEXT;
+END;
+$$;
+
+
+-- Ручное изменение рейтинга админом
+CREATE OR REPLACE FUNCTION admin_change_score(
+    p_project_id bigint,
+    p_admin_id bigint,
+    p_admin_username text,
+    p_amount int,
+    p_reason text
+)
+RETURNS TABLE (
+    project_id bigint,
+    project_name text,
+    category text,
+    score_before int,
+    score_after int,
+    change_amount int
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_project projects%ROWTYPE;
+BEGIN
+    SELECT * INTO v_project FROM projects WHERE id = p_project_id AND deleted_at IS NULL FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    UPDATE projects SET score = score + p_amount WHERE id = p_project_id;
+
+    INSERT INTO rating_history (
+        project_id, admin_id, admin_username, change_type, score_before, score_after,
+        change_amount, reason, is_admin_action
+    ) VALUES (
+        p_project_id, p_admin_id, p_admin_username, 'admin_change', v_project.score, v_project.score + p_amount,
+        p_amount, p_reason, true
+    );
+
+    project_id := v_project.id;
+    project_name := v_project.name;
+    category := v_project.category;
+    score_before := v_project.score;
+    score_after := v_project.score + p_amount;
+    change_amount := p_amount;
+    RETURN NEXT;
+END;
+$$;
+
+
+-- Удаление отзыва админом с откатом его влияния на рейтинг
+CREATE OR REPLACE FUNCTION delete_review(
+    p_log_id bigint,
+    p_admin_id bigint,
+    p_admin_username text
+)
+RETURNS TABLE (
+    project_id bigint,
+    project_name text,
+    category text,
+    rating_val int,
+    review_text text,
+    score_before int,
+    score_after int,
+    change_amount int
+)
+LANGUAGE plpgsql
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_log user_logs%ROWTYPE;
+    v_project projects%ROWTYPE;
+    v_change int;
+BEGIN
+    SELECT * INTO v_log FROM user_logs WHERE id = p_log_id;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    SELECT * INTO v_project FROM projects WHERE id = v_log.project_id AND deleted_at IS NULL FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    -- Повторно читаем отзыв под блокировкой проекта: его могли удалить параллельно
+    SELECT * INTO v_log FROM user_logs WHERE id = p_log_id;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    v_change := -rating_delta(v_log.rating_val);
+
+    INSERT INTO rating_history (
+        project_id, admin_id, admin_username, change_type, score_before, score_after,
+        change_amount, reason, is_admin_action, related_review_id
+    ) VALUES (
+        v_project.id, p_admin_id, p_admin_username, 'delete_review', v_project.score, v_project.score + v_change,
+        v_change, format('Удаление отзыва #%s (оценка: %s/5)', p_log_id, v_log.rating_val), true, p_log_id
+    );
+
+    UPDATE projects SET score = score + v_change WHERE id = v_project.id;
+    DELETE FROM user_logs WHERE id = p_log_id;
+
+    project_id := v_project.id;
+    project_name := v_project.name;
+    category := v_project.category;
+    rating_val := v_log.rating_val;
+    review_text := v_log.review_text;
+    score_before := v_project.score;
+    score_after := v_project.score + v_change;
+    change_amount := v_change;
+    RETURN NEXT;
+END;
+$$;
+
+
+-- find_user_activity из 005: удаленные проекты не показываем и не считаем
+CREATE OR REPLACE FUNCTION find_user_activity(
+    p_user_id bigint DEFAULT NULL,
+    p_username text DEFAULT NULL
+)
+RETURNS TABLE (
+    user_id bigint,
+    username text,
+    reviews_count bigint,
+    likes_count bigint,
+    last_activity_at timestamptz,
+    projects_count bigint,
+    projects jsonb,
+    is_banned boolean,
+    ban_reason text,
+    banned_at timestamptz,
+    banned_by_username text
+)
+LANGUAGE plpgsql STABLE
+AS $$
+#variable_conflict use_column
+DECLARE
+    v_user_id bigint := p_user_id;
+    v_username text;
+BEGIN
+    IF v_user_id IS NULL THEN
+        SELECT h.user_id, h.username INTO v_user_id, v_username
+        FROM rating_history h
+        WHERE lower(h.username) = lower(ltrim(p_username, '@'))
+          AND h.user_id IS NOT NULL
+        ORDER BY h.created_at DESC
+        LIMIT 1;
+        IF v_user_id IS NULL THEN
+            RETURN;
+        END IF;
+    ELSE
+        SELECT h.username INTO v_username
+        FROM rating_history h
+        WHERE h.user_id = v_user_id AND h.username IS NOT NULL
+        ORDER BY h.created_at DESC
+        LIMIT 1;
+    END IF;
+
+    RETURN QUERY
+    SELECT
+        v_user_id,
+        v_username,
+        count(*) FILTER (WHERE l.action_type = 'review'),
+        count(*) FILTER (WHERE l.action_type = 'like'),
+        (SELECT max(h.created_at) FROM rating_history h WHERE h.user_id = v_user_id),
+        count(DISTINCT l.project_id),
+        (
+            SELECT coalesce(jsonb_agg(jsonb_build_object('id', p.id, 'name', p.name) ORDER BY p.score DESC), '[]'::jsonb)
+            FROM (
+                SELECT p.id, p.name, p.score
+                FROM projects p
+                WHERE p.deleted_at IS NULL
+                  AND p.id IN (SELECT ul.project_id FROM user_logs ul WHERE ul.user_id = v_user_id)
+                ORDER BY p.score DESC
+                LIMIT 10
+            ) p
+        ),
+        b.user_id IS NOT NULL,
+        b.reason,
+        b.banned_at::timestamptz,
+        b.banned_by_username
+    FROM (SELECT v_user_id AS user_id) u
+    -- Отзывы и лайки удаленных, но еще не очищенных проектов не считаем
+    LEFT JOIN user_logs l ON l.user_id = u.user_id
+        AND EXISTS (SELECT 1 FROM projects lp WHERE lp.id = l.project_id AND lp.deleted_at IS NULL)
+    LEFT JOIN banned_users b ON b.user_id = u.user_id
+    GROUP BY b.user_id, b.reason, b.banned_at, b.banned_by_username;
+END;
+$$;
@@ -0,0 +1,5 @@
+-- Индекс под keyset-пагинацию /api/projects без категории:
+-- WHERE deleted_at IS NULL AND (score, id) после курсора ORDER BY score DESC, id ASC
+CREATE INDEX IF NOT EXISTS projects_score_id_idx
+    ON projects (score DESC, id)
+    WHERE deleted_at IS NULL;
@@ -0,0 +1,34 @@
+-- Права на функции из 002-006.
+-- По умолчанию EXECUTE есть у PUBLIC (а в Supabase еще и явно у anon и
+-- authenticated), поэтому через PostgREST с anon-ключом любой мог вызвать
+-- admin_change_score, delete_review, delete_project и т.д. с произвольным
+-- p_admin_id. Вызывать их может только бот: он подключается ключом
+-- service_role (SUPABASE_KEY бота). Если бот работает под другой ролью,
+-- замените service_role ниже.
+-- Применять после 006: CREATE OR REPLACE сохраняет права, выданные здесь.
+
+DO $$
+DECLARE
+    v_function regprocedure;
+BEGIN
+    FOREACH v_function IN ARRAY ARRAY[
+        'rating_delta(int)',
+        'submit_review(bigint, bigint, text, text, int)',
+        'add_like(bigint, bigint, text)',
+        'admin_change_score(bigint, bigint, text, int, text)',
+        'delete_review(bigint, bigint, text)',
+        'project_stats(bigint)',
+        'project_counters_apply(bigint, text, int, int)',
+        'user_logs_counters_trigger()',
+        'reconcile_project_counters()',
+        'find_user_activity(bigint, text)',
+        'projects_deleted_guard()',
+        'delete_project(bigint, bigint, text, int)',
+        'purge_deleted_projects(int)'
+    ]::regprocedure[]
+    LOOP
+        EXECUTE format('REVOKE EXECUTE ON FUNCTION %s FROM PUBLIC, anon, authenticated', v_function);
+        EXECUTE format('GRANT EXECUTE ON FUNCTION %s TO service_role', v_function);
+    END LOOP;
+END;
+$$;
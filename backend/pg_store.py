@@ -0,0 +1,84 @@
+"""Чтение проектов для API напрямую из Postgres (asyncpg), минуя PostgREST.
+
+Включается переменной DATABASE_URL в api.py. Пул соединений asyncpg
+готовит каждый текст запроса один раз на соединение (кэш prepared
+statements), дальше передаются только параметры. Поэтому запросы здесь
+собираются из фиксированных частей: набор вариантов (колонки из белого
+списка, есть ли категория и курсор) ограничен и целиком помещается в кэш.
+
+С пулером Supabase в режиме transaction prepared statements не
+работают — нужен прямой адрес базы или пулер в режиме session.
+"""
+import logging
+from functools import lru_cache
+
+# Колонки projects, которые можно выбирать (имена подставляются в SQL)
+PROJECT_COLUMNS = ("id", "name", "description", "category", "score")
+
+
+def _columns_sql(columns: str) -> str:
+    names = [name.strip() for name in columns.split(",")] if columns and columns != "*" else PROJECT_COLUMNS
+    unknown = [name for name in names if name not in PROJECT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Неизвестные колонки: {', '.join(unknown)}")
+    return ", ".join(names)
+
+
+@lru_cache(maxsize=256)
+def page_sql(columns: str, with_category: bool, with_cursor: bool) -> str:
+    """Страница проектов по ключу (score DESC, id ASC), как db.list_projects_page"""
+    conditions = ["deleted_at IS NULL"]
+    args = 0
+    if with_category:
+        args += 1
+        conditions.append(f"category = ${args}")
+    if with_cursor:
+        conditions.append(f"(score < ${args + 1} OR (score = ${args + 1} AND id > ${args + 2}))")
+        args += 2
+    return (
+        f"SELECT {_columns_sql(columns)} FROM projects "
+        f"WHERE {' AND '.join(conditions)} "
+        f"ORDER BY score DESC, id LIMIT ${args + 1}"
+    )
+
+
+@lru_cache(maxsize=256)
+def project_sql(columns: str) -> str:
+    return f"SELECT {_columns_sql(columns)} FROM projects WHERE id = $1 AND deleted_at IS NULL"
+
+
+class PgStore:
+    """Пул asyncpg с теми же функциями чтения, что и db.py"""
+
+    def __init__(self, dsn: str, min_size: int = 2, max_size: int = 10):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = None
+
+    async def start(self):
+        try:
+            import asyncpg
+        except ImportError:
+            raise RuntimeError("Для DATABASE_URL установите пакет asyncpg")
+        self._pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+        logging.info(f"Пул asyncpg создан: {self.min_size}-{self.max_size} соединений")
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def list_projects_page(self, category: str = None, after=None, limit: int = 20, columns: str = "*"):
+        args = []
+        if category:
+            args.append(category)
+        if after is not None:
+            args.extend(after)
+        args.append(limit)
+        rows = await self._pool.fetch(page_sql(columns, bool(category), after is not None), *args)
+        return [dict(row) for row in rows]
+
+    async def get_project(self, project_id: int, columns: str = "*"):
+        row = await self._pool.fetchrow(project_sql(columns), project_id)
+        return dict(row) if row is not None else None
@@ -0,0 +1,39 @@
+"""Кэш file_id фотографий проектов в памяти процесса.
+
+Хранит и найденные фото, и их отсутствие, чтобы страница категории не
+ходила в project_photos за уже известными проектами. Сбрасывается при
+сохранении фото и удалении проекта.
+"""
+import db
+
+
+class PhotoCache:
+    """project_id -> photo_file_id (None, если фото нет)"""
+
+    def __init__(self):
+        self._items = {}
+
+    async def get(self, project_id: int):
+        """file_id фото проекта или None"""
+        photos = await self.get_many([project_id])
+        return photos.get(project_id)
+
+    async def get_many(self, project_ids) -> dict:
+        """file_id для набора проектов; недостающие догружаются одним запросом"""
+        missing = [p_id for p_id in project_ids if p_id not in self._items]
+        if missing:
+            found = await db.get_project_photos(missing)
+            for p_id in missing:
+                self._items[p_id] = found.get(p_id)
+        return {p_id: self._items[p_id] for p_id in project_ids}
+
+    def set(self, project_id: int, photo_file_id: str):
+        """Запоминает новое фото проекта"""
+        self._items[project_id] = photo_file_id
+
+    def invalidate(self, project_id: int = None):
+        """Сбрасывает запись проекта или весь кэш"""
+        if project_id is None:
+            self._items.clear()
+        else:
+            self._items.pop(project_id, None)
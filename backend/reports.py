@@ -0,0 +1,105 @@
+"""Постраничные админ-отчеты в одном сообщении.
+
+Команда собирает снимок отчета (готовые HTML-записи) и отправляет только
+первую страницу с кнопками ◀️/▶️. Остальные страницы рендерятся по
+нажатию из снимка в памяти, сообщение редактируется на месте. Страницы
+делятся только между записями, поэтому HTML-теги не разрываются.
+Идентификатор снимка случайный: кнопки старого отчета (после перезапуска
+или вытеснения из кэша) не откроют чужие данные. Внизу каждой страницы
+указано время снимка: листание показывает данные на этот момент.
+"""
+import secrets
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+CALLBACK_PREFIX = "report_"
+
+
+class Report:
+    """Снимок отчета: заголовок, записи и разбиение на страницы"""
+
+    def __init__(self, title: str, entries, footer: str = "", page_limit: int = 3500, max_entries: int = 20):
+        self.title = title
+        self.footer = footer
+        self.entries = list(entries)
+        self.created_at = time.time()
+        created = datetime.fromtimestamp(self.created_at, timezone.utc)
+        self.stamp = f"\n<i>🕒 Снимок от {created:%d.%m.%Y %H:%M} UTC</i>"
+        self.pages = self._split(page_limit, max_entries)
+
+    def _split(self, page_limit: int, max_entries: int):
+        """Границы страниц [(start, end)] по длине текста и числу записей"""
+        budget = page_limit - len(self.title) - len(self.footer) - len(self.stamp)
+        pages = []
+        start = 0
+        size = 0
+        for i, entry in enumerate(self.entries):
+            if i > start and (size + len(entry) > budget or i - start >= max_entries):
+                pages.append((start, i))
+                start = i
+                size = 0
+            size += len(entry)
+        pages.append((start, len(self.entries)))
+        return pages
+
+    def render(self, page: int) -> str:
+        start, end = self.pages[page]
+        text = self.title + "".join(self.entries[start:end])
+        if page == len(self.pages) - 1:
+            text += self.footer
+        return text + self.stamp
+
+
+class ReportCache:
+    """LRU-кэш снимков отчетов с временем жизни"""
+
+    def __init__(self, ttl: float = 3600, max_size: int = 100):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items = OrderedDict()  # report_id -> (Report, expires_at)
+
+    def add(self, report: Report) -> str:
+        """Сохраняет снимок и возвращает его идентификатор"""
+        report_id = secrets.token_hex(4)
+        self._items[report_id] = (report, time.monotonic() + self.ttl)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        return report_id
+
+    def get(self, report_id: str):
+        """Снимок или None, если он устарел или вытеснен"""
+        item = self._items.get(report_id)
+        if item is None:
+            return None
+        report, expires_at = item
+        if expires_at < time.monotonic():
+            del self._items[report_id]
+            return None
+        self._items.move_to_end(report_id)
+        return report
+
+    def __len__(self):
+        return len(self._items)
+
+
+def report_kb(report_id: str, report: Report, page: int):
+    """Кнопки ◀️ N/M ▶️ (None, если страница одна)"""
+    total = len(report.pages)
+    if total == 1:
+        return None
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton(text="◀️", callback_data=f"{CALLBACK_PREFIX}{report_id}_{page - 1}"))
+    row.append(InlineKeyboardButton(text=f"{page + 1}/{total}", callback_data=f"{CALLBACK_PREFIX}{report_id}_{page}"))
+    if page < total - 1:
+        row.append(InlineKeyboardButton(text="▶️", callback_data=f"{CALLBACK_PREFIX}{report_id}_{page + 1}"))
+    return InlineKeyboardMarkup(inline_keyboard=[row])
+
+
+def parse_callback(data: str):
+    """report_<id>_<page> -> (id, page)"""
+    report_id, page = data[len(CALLBACK_PREFIX):].rsplit("_", 1)
+    return report_id, int(page)
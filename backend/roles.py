@@ -0,0 +1,53 @@
+"""Кэш ролей пользователей (админ / не админ) с TTL и вытеснением.
+
+Статус берется из участия в админ-группе. Кэш заполняется при первой
+проверке и обновляется по апдейтам chat_member этой группы, поэтому
+get_chat_member вызывается только для новых или устаревших записей.
+"""
+import time
+from collections import OrderedDict
+
+# Статусы участника админ-группы, которые дают права администратора бота
+ADMIN_STATUSES = frozenset({"creator", "administrator", "member"})
+
+
+class RoleCache:
+    """LRU-кэш user_id -> is_admin с временем жизни записей"""
+
+    def __init__(self, ttl: float = 300, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items = OrderedDict()  # user_id -> (is_admin, expires_at)
+
+    def get(self, user_id: int):
+        """Возвращает is_admin из кэша или None, если записи нет или она устарела"""
+        item = self._items.get(user_id)
+        if item is None:
+            return None
+        is_admin, expires_at = item
+        if expires_at < time.monotonic():
+            del self._items[user_id]
+            return None
+        self._items.move_to_end(user_id)
+        return is_admin
+
+    def set(self, user_id: int, is_admin: bool):
+        """Запоминает роль пользователя"""
+        self._items[user_id] = (is_admin, time.monotonic() + self.ttl)
+        self._items.move_to_end(user_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def set_status(self, user_id: int, status: str):
+        """Запоминает роль по статусу участника группы"""
+        self.set(user_id, status in ADMIN_STATUSES)
+
+    def invalidate(self, user_id: int = None):
+        """Сбрасывает запись пользователя или весь кэш"""
+        if user_id is None:
+            self._items.clear()
+        else:
+            self._items.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,206 @@
+"""Индекс поиска проектов в памяти процесса.
+
+Заменяет ilike('%запрос%') в Postgres. Названия ищутся по триграммам (как
+в pg_trgm): находятся и названия с опечатками, а результаты ранжируются по
+похожести, при равной похожести — по рейтингу. Описания ищутся по началам
+слов. Регистр, ё/е и знаки препинания не учитываются. Индекс строится при
+старте, обновляется командами /add, /del, /editdesc и изменениями рейтинга
+и периодически перестраивается, чтобы подхватывать проекты, измененные
+в других процессах или напрямую в БД.
+"""
+import asyncio
+import bisect
+import logging
+import re
+from collections import Counter
+
+import db
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    """Нижний регистр, ё -> е, только буквы и цифры через пробел"""
+    text = (text or "").casefold().replace("ё", "е")
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def word_trigrams(word: str) -> frozenset:
+    """Триграммы слова, дополненного пробелами (как в pg_trgm)"""
+    padded = f"  {word} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _similarity(a: frozenset, b: frozenset) -> float:
+    common = len(a & b)
+    return common / (len(a) + len(b) - common) if common else 0.0
+
+
+class SearchIndex:
+    """project_id -> проект, триграммы названий и слова описаний"""
+
+    def __init__(self, min_similarity: float = 0.3, description_weight: float = 0.4):
+        self.min_similarity = min_similarity
+        self.description_weight = description_weight
+        self._projects = {}
+        self._names = {}  # project_id -> (название, триграммы названия, [триграммы слов])
+        self._name_postings = {}  # триграмма -> {project_id}
+        self._description_words = {}  # project_id -> слова описания
+        self._word_postings = {}  # слово описания -> {project_id}
+        self._sorted_words = []  # слова описаний по алфавиту (поиск по префиксу)
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._projects)
+
+    def add(self, project: dict):
+        """Добавляет или заменяет проект (после /add, /editdesc)"""
+        project_id = project['id']
+        self.remove(project_id)
+        name = normalize(project['name'])
+        words = [word_trigrams(word) for word in name.split()]
+        name_grams = frozenset().union(*words)
+        description_words = set(normalize(project.get('description')).split())
+
+        self._projects[project_id] = {
+            "id": project_id,
+            "name": project['name'],
+            "category": project['category'],
+            "description": project.get('description') or "",
+            "score": project.get('score', 0),
+        }
+        self._names[project_id] = (name, name_grams, words)
+        for gram in name_grams:
+            self._name_postings.setdefault(gram, set()).add(project_id)
+        self._description_words[project_id] = description_words
+        for word in description_words:
+            ids = self._word_postings.get(word)
+            if ids is None:
+                ids = self._word_postings[word] = set()
+                bisect.insort(self._sorted_words, word)
+            ids.add(project_id)
+
+    def remove(self, project_id: int):
+        """Убирает проект из индекса (после /del)"""
+        if self._projects.pop(project_id, None) is None:
+            return
+        _, name_grams, _ = self._names.pop(project_id)
+        for gram in name_grams:
+            ids = self._name_postings[gram]
+            ids.discard(project_id)
+            if not ids:
+                del self._name_postings[gram]
+        for word in self._description_words.pop(project_id):
+            ids = self._word_postings[word]
+            ids.discard(project_id)
+            if not ids:
+                del self._word_postings[word]
+                del self._sorted_words[bisect.bisect_left(self._sorted_words, word)]
+
+    def set_score(self, project_id: int, score: int):
+        """Новый рейтинг проекта (для сортировки результатов)"""
+        project = self._projects.get(project_id)
+        if project is not None:
+            project['score'] = score
+
+    def _description_matches(self, query_words):
+        """Проекты, в описании которых есть слова, начинающиеся с каждого слова запроса"""
+        matched = None
+        for query_word in query_words:
+            ids = set()
+            position = bisect.bisect_left(self._sorted_words, query_word)
+            while position < len(self._sorted_words) and self._sorted_words[position].startswith(query_word):
+                ids |= self._word_postings[self._sorted_words[position]]
+                position += 1
+            matched = ids if matched is None else matched & ids
+            if not matched:
+                return set()
+        return matched
+
+    def _rank(self, query: str):
+        """(похожесть, рейтинг, project_id) подходящих проектов, лучшие первыми"""
+        query = normalize(query)
+        if not query:
+            return []
+        query_words = query.split()
+        query_word_grams = [word_trigrams(word) for word in query_words]
+        query_grams = frozenset().union(*query_word_grams)
+
+        hits = Counter()
+        for gram in query_grams:
+            hits.update(self._name_postings.get(gram, ()))
+
+        ranked = {}
+        for project_id, common in hits.items():
+            name, name_grams, name_words = self._names[project_id]
+            similarity = common / (len(query_grams) + len(name_grams) - common)
+            if len(query_words) == 1:
+                # Одно слово сравниваем с каждым словом названия ("поддржка" ~ "Бот поддержки")
+                similarity = max([similarity] + [_similarity(query_word_grams[0], w) for w in name_words])
+            if query in name:
+                # Подстрока названия (как раньше в ilike) всегда проходит порог,
+                # начало слова важнее середины
+                ratio = len(query) / len(name)
+                if name.startswith(query) or f" {query}" in name:
+                    similarity = max(similarity, 0.7 + 0.3 * ratio)
+                else:
+                    similarity = max(similarity, 0.5 + 0.2 * ratio)
+            if similarity >= self.min_similarity:
+                ranked[project_id] = similarity
+
+        if self.description_weight >= self.min_similarity:
+            for project_id in self._description_matches(query_words):
+                ranked[project_id] = max(ranked.get(project_id, 0), self.description_weight)
+
+        result = [(similarity, self._projects[project_id]['score'], project_id)
+                  for project_id, similarity in ranked.items()]
+        result.sort(key=lambda item: (-item[0], -item[1], item[2]))
+        return result
+
+    def search(self, query: str, limit: int = 10):
+        """Проекты, похожие на запрос: по похожести, затем по рейтингу"""
+        return [dict(self._projects[project_id]) for _, _, project_id in self._rank(query)[:limit]]
+
+    def find(self, name: str):
+        """Проект для админ-команд: точное совпадение названия (без учета регистра и ё),
+        иначе лучший проект, в названии которого есть эта строка.
+
+        Нечеткие совпадения здесь не возвращаются, чтобы опечатка в /del
+        не задела другой проект.
+        """
+        target = normalize(name)
+        if not target:
+            return None
+        containing = None
+        for _, _, project_id in self._rank(name):
+            project_name = self._names[project_id][0]
+            if project_name == target:
+                return dict(self._projects[project_id])
+            if containing is None and target in project_name:
+                containing = project_id
+        return dict(self._projects[containing]) if containing is not None else None
+
+    async def load(self):
+        """Полностью перестраивает индекс по таблице projects"""
+        projects = await db.list_all_projects()
+        fresh = SearchIndex(self.min_similarity, self.description_weight)
+        for project in projects:
+            fresh.add(project)
+        # Подменяем содержимое целиком, чтобы поиск не видел недостроенный индекс
+        self._projects = fresh._projects
+        self._names = fresh._names
+        self._name_postings = fresh._name_postings
+        self._description_words = fresh._description_words
+        self._word_postings = fresh._word_postings
+        self._sorted_words = fresh._sorted_words
+        self.loaded = True
+        return len(self._projects)
+
+    async def refresh_forever(self, interval: float):
+        """Фоновая пересборка по таблице projects"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.load()
+            except Exception as e:
+                logging.error(f"Ошибка обновления поискового индекса: {e}")
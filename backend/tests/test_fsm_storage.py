@@ -0,0 +1,136 @@
+"""Проверка хранилищ FSM: SQLite-файл и Redis-заглушка в памяти.
+
+Запуск (из корня репозитория): python -m pytest backend/tests
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aiogram.fsm.context import FSMContext  # noqa: E402
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+
+import fsm_storage  # noqa: E402
+from fsm_storage import RedisFSMStorage, SQLiteFSMStorage, advance_state  # noqa: E402
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+class FakePipeline:
+    """Команды копятся и выполняются по execute(), как MULTI/EXEC"""
+
+    def __init__(self, redis):
+        self._redis = redis
+        self._commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self._commands.append((name, args, kwargs))
+
+    async def execute(self):
+        for name, args, kwargs in self._commands:
+            await getattr(self._redis, name)(*args, **kwargs)
+        self._commands = []
+
+
+class FakeRedis:
+    """Подмножество redis.asyncio, которым пользуется RedisFSMStorage (TTL не моделируется)"""
+
+    def __init__(self):
+        self.values = {}
+        self.hashes = {}
+
+    def pipeline(self, transaction: bool = True):
+        return FakePipeline(self)
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+        self.hashes.pop(key, None)
+
+    async def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    async def expire(self, key, seconds):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def storage(request, tmp_path):
+    if request.param == "sqlite":
+        storage = SQLiteFSMStorage(str(tmp_path / "fsm.sqlite3"), ttl=3600)
+    else:
+        storage = RedisFSMStorage(FakeRedis(), ttl=3600)
+    yield storage
+    asyncio.run(storage.close())
+
+
+def test_round_trip(storage):
+    async def scenario():
+        context = FSMContext(storage=storage, key=KEY)
+        await context.set_state("ReviewState:waiting_for_text")
+        await context.update_data(p_id="5", draft={"a": 1, "b": 2})
+        await advance_state(context, "ReviewState:waiting_for_rate", txt="отзыв", draft={"a": 3})
+        return await context.get_state(), await context.get_data()
+
+    state, data = asyncio.run(scenario())
+    assert state == "ReviewState:waiting_for_rate"
+    # Слияние только верхнего уровня, как у update_data в aiogram
+    assert data == {"p_id": "5", "draft": {"a": 3}, "txt": "отзыв"}
+
+
+def test_none_is_kept_as_value(storage):
+    async def scenario():
+        context = FSMContext(storage=storage, key=KEY)
+        await context.update_data(p_id="5", txt="старый")
+        await advance_state(context, "ReviewState:waiting_for_rate", txt=None)
+        return await context.get_data()
+
+    assert asyncio.run(scenario()) == {"p_id": "5", "txt": None}
+
+
+def test_clear(storage):
+    async def scenario():
+        context = FSMContext(storage=storage, key=KEY)
+        await advance_state(context, "ReviewState:waiting_for_rate", txt="отзыв")
+        await context.clear()
+        return await context.get_state(), await context.get_data()
+
+    assert asyncio.run(scenario()) == (None, {})
+
+
+def test_sqlite_purges_expired_rows(tmp_path, monkeypatch):
+    storage = SQLiteFSMStorage(str(tmp_path / "fsm.sqlite3"), ttl=60, purge_interval=60)
+    other = StorageKey(bot_id=1, chat_id=20, user_id=20)
+    asyncio.run(storage.set_state(KEY, "ReviewState:waiting_for_text"))
+
+    now = time.time() + 120
+    monkeypatch.setattr(fsm_storage.time, "time", lambda: now)
+    asyncio.run(storage.set_state(other, "ReviewState:waiting_for_text"))
+
+    rows = storage._conn.execute("SELECT count(*) FROM fsm").fetchone()[0]
+    assert rows == 1
+    assert asyncio.run(storage.get_state(KEY)) is None
+    asyncio.run(storage.close())
@@ -0,0 +1,151 @@
+"""Скользящий топ недели по изменению рейтинга.
+
+Держит в памяти суммы change_amount по проектам в дневных корзинах за
+последние N дней. Корзины заполняются из rating_history при старте и
+пополняются теми же обработчиками, которые пишут историю. Данные проектов
+(название, категория, рейтинг) берутся из кэша, поэтому топ строится без
+запросов к базе. Изменения, сделанные во время перезагрузки из базы, не
+теряются: они накладываются на прочитанные корзины (как в bans.BanIndex).
+"""
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import db
+
+
+def _today():
+    return datetime.now(timezone.utc).date()
+
+
+class WeeklyTop:
+    """project_id -> {дата: сумма изменений за день}"""
+
+    def __init__(self, days: int = 7):
+        self.days = days
+        self._buckets = {}
+        self._projects = {}  # project_id -> {id, name, category, score}
+        # Номер локального изменения; пока идут загрузки, изменения
+        # запоминаются [(номер, project_id, amount или None — удаление, день)]
+        self._generation = 0
+        self._loading = 0
+        self._changes = []
+        self._last_history_id = None  # последний id rating_history прошлой загрузки
+
+    def _window_start(self):
+        return _today() - timedelta(days=self.days - 1)
+
+    def _add(self, project_id: int, amount: int, day):
+        if day < self._window_start():
+            return
+        days = self._buckets.setdefault(project_id, {})
+        days[day] = days.get(day, 0) + amount
+
+    def remember_project(self, project: dict):
+        """Обновляет кэш данных проекта (после изменения рейтинга и т.п.)"""
+        self._projects[project['id']] = {
+            "id": project['id'],
+            "name": project['name'],
+            "category": project['category'],
+            "score": project['score'],
+        }
+
+    def record(self, project: dict, amount: int):
+        """Учитывает изменение рейтинга; project — данные проекта с новым score"""
+        project = {**project, "id": int(project['id'])}
+        self.remember_project(project)
+        self._add(project['id'], amount, _today())
+        self._changed(project['id'], amount)
+
+    def remove_project(self, project_id: int):
+        """Убирает удаленный проект из топа"""
+        self._buckets.pop(project_id, None)
+        self._projects.pop(project_id, None)
+        self._changed(project_id, None)
+
+    def _changed(self, project_id: int, amount):
+        self._generation += 1
+        if self._loading:
+            self._changes.append((self._generation, project_id, amount, _today()))
+
+    async def load(self):
+        """Заполняет корзины из rating_history за окно и сбрасывает кэш проектов"""
+        since = datetime.combine(self._window_start(), datetime.min.time(), tzinfo=timezone.utc)
+        generation = self._generation
+        self._loading += 1
+        try:
+            rows = await db.list_history_changes_since(since.isoformat())
+        finally:
+            self._loading -= 1
+        changes = [change for change in self._changes if change[0] > generation]
+        if not self._loading:
+            self._changes = []
+
+        self._buckets = {}
+        # Название и рейтинг могли измениться, а проект — удалиться в другом воркере:
+        # top() догрузит свежие данные одним запросом
+        self._projects = {}
+        for row in rows:
+            created = datetime.fromisoformat(row['created_at'])
+            if created.tzinfo is None:
+                created = created.replace(tzinfo=timezone.utc)
+            self._add(row['project_id'], row['change_amount'] or 0, created.astimezone(timezone.utc).date())
+
+        # record() и remove_project() во время чтения накладываем поверх. Изменение,
+        # строка которого уже попала в выборку (новее прошлой загрузки, тот же проект
+        # и сумма), второй раз не учитываем
+        fresh_rows = Counter(
+            (row['project_id'], row['change_amount'] or 0)
+            for row in rows
+            if self._last_history_id is None or row['id'] > self._last_history_id
+        )
+        for _, project_id, amount, day in changes:
+            if amount is None:
+                self._buckets.pop(project_id, None)
+            elif fresh_rows[(project_id, amount)]:
+                fresh_rows[(project_id, amount)] -= 1
+            else:
+                self._add(project_id, amount, day)
+        if rows:
+            self._last_history_id = max(row['id'] for row in rows)
+        return len(rows)
+
+    def _prune(self):
+        start = self._window_start()
+        for project_id in list(self._buckets):
+            days = self._buckets[project_id]
+            for day in [d for d in days if d < start]:
+                del days[day]
+            if not days:
+                del self._buckets[project_id]
+
+    async def top(self, limit: int = 10):
+        """Топ проектов за окно: копии данных проекта с ключом weekly_change"""
+        self._prune()
+        totals = sorted(
+            ((sum(days.values()), project_id) for project_id, days in self._buckets.items()),
+            key=lambda item: (-item[0], item[1])
+        )
+
+        result = []
+        position = 0
+        # Удаленные проекты пропускаем и добираем следующих кандидатов до limit
+        while len(result) < limit and position < len(totals):
+            batch = totals[position:position + limit - len(result)]
+            position += len(batch)
+
+            # Проекты, которых еще нет в кэше, догружаем одним запросом
+            missing = [project_id for _, project_id in batch if project_id not in self._projects]
+            if missing:
+                for project in await db.get_projects_by_ids(missing):
+                    self.remember_project(project)
+
+            for total, project_id in batch:
+                project = self._projects.get(project_id)
+                if project is None:
+                    logging.warning(f"Проект {project_id} из топа недели не найден")
+                    # Проект удален: до следующей загрузки больше не запрашиваем
+                    self._buckets.pop(project_id, None)
+                    continue
+                result.append({**project, "weekly_change": total})
+        return result
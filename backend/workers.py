@@ -0,0 +1,198 @@
+"""Несколько процессов-воркеров за одним приемником апдейтов.
+
+Приемник (polling или webhook) не разбирает апдейты, а только кладет их
+сырой JSON в очередь воркера user_id % N. Все апдейты пользователя всегда
+попадают в один и тот же процесс, поэтому:
+- внутри воркера они обрабатываются строго по порядку (апдейты разных
+  пользователей — параллельно);
+- состояние FSM пользователя живет в одном процессе, и даже MemoryStorage
+  остается корректным, пока число воркеров не меняется.
+Апдейты chat_member (смена ролей в админ-группе) рассылаются всем воркерам,
+чтобы каждый обновил свой кэш ролей. Так же, через очереди, воркеры
+рассылают друг другу служебные сообщения (broadcast_control), например о
+банах: пользователя обслуживает не тот воркер, что выполнил /ban.
+Упавший воркер приемник перезапускает при следующем апдейте для него.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+
+# Типы апдейтов, которые нужны каждому воркеру
+BROADCAST_UPDATES = {"chat_member"}
+# Ключ служебного сообщения между воркерами (в апдейтах Telegram его нет)
+CONTROL_FIELD = "_worker_control"
+
+_peers = []  # очереди остальных воркеров; заполняется в процессе-воркере
+
+
+def update_user_id(update: dict) -> int:
+    """ID пользователя, от которого пришел апдейт (0, если его нет)"""
+    for event in update.values():
+        if not isinstance(event, dict):
+            continue
+        sender = event.get("from") or event.get("user")
+        if sender:
+            return sender["id"]
+        chat = event.get("chat")
+        if chat:
+            return chat["id"]
+    return 0
+
+
+def _is_broadcast(update: dict) -> bool:
+    return any(field in update for field in BROADCAST_UPDATES)
+
+
+def broadcast_control(message: dict):
+    """Отправляет служебное сообщение остальным воркерам (без воркеров — ничего)"""
+    for queue in _peers:
+        queue.put({CONTROL_FIELD: message})
+
+
+def _worker_process(entrypoint, index: int, queues, args):
+    # Ctrl+C получает вся группа процессов; останавливает воркеры приемник
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _peers.extend(queue for peer, queue in enumerate(queues) if peer != index)
+    asyncio.run(entrypoint(index, queues[index], *args))
+
+
+class WorkerPool:
+    """Процессы-воркеры и их очереди апдейтов
+
+    entrypoint(index, queue, *args) — корутина, которая выполняется в каждом
+    воркере; должна быть функцией уровня модуля (процессы запускаются через
+    spawn). worker_env(index) — переменные окружения конкретного воркера.
+    """
+
+    def __init__(self, entrypoint, workers: int, args=(), worker_env=None):
+        self.entrypoint = entrypoint
+        self.workers = workers
+        self.args = args
+        self.worker_env = worker_env
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = []
+        self._processes = []
+
+    def start(self):
+        # Все очереди создаются заранее: каждый воркер получает очереди остальных
+        self._queues = [self._context.Queue() for _ in range(self.workers)]
+        self._processes = [self._spawn(index) for index in range(self.workers)]
+        logging.info(f"Запущено воркеров: {self.workers}")
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=_worker_process,
+            args=(self.entrypoint, index, self._queues, self.args),
+            name=f"bot-worker-{index}"
+        )
+        env = self.worker_env(index) if self.worker_env else {}
+        saved = {key: os.environ.get(key) for key in env}
+        # Дочерний процесс получает окружение на момент запуска
+        os.environ.update(env)
+        try:
+            process.start()
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        return process
+
+    def _queue(self, index: int):
+        """Очередь воркера; упавший воркер перезапускается и читает ту же очередь"""
+        process = self._processes[index]
+        if not process.is_alive():
+            logging.error(f"Воркер {index} завершился (код {process.exitcode}), перезапускаю")
+            self._processes[index] = self._spawn(index)
+        return self._queues[index]
+
+    def dispatch(self, update: dict):
+        """Отдает сырой апдейт воркеру его пользователя"""
+        if _is_broadcast(update):
+            for index in range(self.workers):
+                self._queue(index).put(update)
+            return
+        self._queue(update_user_id(update) % self.workers).put(update)
+
+    async def stop(self):
+        """Воркеры дорабатывают уже полученные апдейты и завершаются"""
+        for queue in self._queues:
+            queue.put(None)
+        for process in self._processes:
+            await asyncio.to_thread(process.join)
+        self._queues = []
+        self._processes = []
+
+
+async def _feed_after(previous, dp, bot, update: dict):
+    if previous is not None:
+        # Ошибка предыдущего апдейта не должна блокировать следующий
+        await asyncio.wait([previous])
+    try:
+        await dp.feed_raw_update(bot, update)
+    except Exception as e:
+        logging.error(f"Ошибка обработки апдейта {update.get('update_id')}: {e}")
+
+
+async def consume_updates(dp, bot, queue, on_control=None):
+    """Цикл воркера: апдейты одного пользователя по очереди, разных — параллельно
+
+    on_control(message) вызывается для служебных сообщений других воркеров.
+    """
+    loop = asyncio.get_running_loop()
+    tails = {}  # user_id -> задача последнего апдейта пользователя
+
+    def forget(user_id, task):
+        if tails.get(user_id) is task:
+            del tails[user_id]
+
+    while True:
+        update = await loop.run_in_executor(None, queue.get)
+        if update is None:
+            break
+        if CONTROL_FIELD in update:
+            try:
+                if on_control:
+                    on_control(update[CONTROL_FIELD])
+            except Exception as e:
+                logging.error(f"Ошибка служебного сообщения воркера: {e}")
+            continue
+        user_id = update_user_id(update)
+        task = asyncio.create_task(_feed_after(tails.get(user_id), dp, bot, update))
+        tails[user_id] = task
+        task.add_done_callback(lambda t, u=user_id: forget(u, t))
+
+    # Последняя задача каждого пользователя ждет все предыдущие
+    await asyncio.gather(*tails.values(), return_exceptions=True)
+
+
+async def poll_updates(bot, pool: WorkerPool, allowed_updates, stop_event: asyncio.Event):
+    """Long polling в приемнике: апдейты уходят в воркеры без разбора хендлерами"""
+    offset = None
+
+    async def poll():
+        nonlocal offset
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+            except Exception as e:
+                logging.error(f"Ошибка получения апдейтов: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                pool.dispatch(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+                offset = update.update_id + 1
+
+    task = asyncio.create_task(poll())
+    await stop_event.wait()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    if offset is not None:
+        # Подтверждаем последние отданные апдейты, чтобы после перезапуска они не пришли снова
+        try:
+            await bot.get_updates(offset=offset, limit=1, timeout=0)
+        except Exception as e:
+            logging.error(f"Ошибка подтверждения апдейтов: {e}")
@@ -0,0 +1,88 @@
+"""Нагрузочный тест API (backend/api.py) с имитацией задержки базы.
+
+Запросы к базе подменяются ожиданием latency секунд: asyncio.sleep для
+асинхронного клиента (как сейчас) или time.sleep с --blocking (как раньше
+синхронный клиент внутри async def). Приложение вызывается в процессе
+через ASGI-транспорт httpx, без сети. У каждого запроса свой курсор, чтобы
+он не попал в кэш снимков и дошел до «базы».
+
+Запуск: python benchmarks/bench_api.py [--requests 400] [--latency 0.05] [--concurrency 1 8 32 64] [--blocking]
+Нужны fastapi и httpx.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import httpx  # noqa: E402
+
+import api  # noqa: E402
+
+
+def fake_page(limit: int):
+    return [
+        {"id": i, "name": f"Проект {i}", "description": "описание " * 20, "category": "bots", "score": 1000 - i}
+        for i in range(limit)
+    ]
+
+
+def patch_db(latency: float, blocking: bool):
+    async def list_projects_page(category=None, after=None, limit=20, columns="*"):
+        if blocking:
+            time.sleep(latency)
+        else:
+            await asyncio.sleep(latency)
+        return fake_page(limit)
+
+    api.db.list_projects_page = list_projects_page
+
+
+async def run(requests: int, concurrency: int, first: int):
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Курсоры каждого замера свои: иначе следующий замер отвечал бы из кэша снимков
+        counter = iter(range(first, first + requests))
+        errors = 0
+
+        async def user():
+            nonlocal errors
+            for i in counter:
+                response = await client.get("/api/projects", params={"after": f"{10 ** 6 - i},{i}"})
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return requests / elapsed, errors
+
+
+async def bench(requests: int, levels):
+    # Один цикл событий на все замеры: семафор базы в api.py привязывается к нему
+    baseline = None
+    for level, concurrency in enumerate(levels):
+        rate, errors = await run(requests, concurrency, level * requests)
+        baseline = baseline or rate
+        print(f"параллельно: {concurrency:<4} {rate:8.1f} запросов/с  x{rate / baseline:.2f}  ошибок: {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.05, help="ожидание базы на запрос, с")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--blocking", action="store_true", help="блокирующий клиент базы (как раньше)")
+    args = parser.parse_args()
+
+    patch_db(args.latency, args.blocking)
+    mode = "блокирующий" if args.blocking else "асинхронный"
+    print(f"Запросов: {args.requests}, задержка базы: {args.latency * 1000:.0f} мс, клиент: {mode}, "
+          f"API_DB_CONCURRENCY={api.API_DB_CONCURRENCY}")
+    asyncio.run(bench(args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Бенчмарк: синхронный vs асинхронный доступ к базе внутри хендлеров aiogram.
+
+Вызывает настоящие функции backend/db.py, но вместо Supabase подставляет
+клиент-заглушку: каждый execute() ждет latency секунд и возвращает
+фиктивные строки. Апдейт повторяет то, что делает бот при открытии
+проекта и отправке отзыва: get_project, затем get_user_action и
+list_history параллельно (asyncio.gather, как в main.py), затем
+submit_review через RPC. "До" — заглушка блокирует цикл событий
+(time.sleep, как синхронный клиент внутри async-хендлера), "после" —
+asyncio.sleep, как асинхронный клиент.
+
+Запуск: python benchmarks/bench_async_db.py [--updates 100] [--latency 0.03]
+Нужен пакет supabase (db.py импортирует его при загрузке).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import db  # noqa: E402
+
+PROJECT = {"id": 1, "name": "Проект", "description": "описание", "category": "bots", "score": 1000}
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    """Цепочка PostgREST-запроса: любые фильтры возвращают сам запрос"""
+
+    def __init__(self, client, data):
+        self._client = client
+        self._data = data
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    async def execute(self):
+        self._client.queries += 1
+        if self._client.blocking:
+            time.sleep(self._client.latency)
+        else:
+            await asyncio.sleep(self._client.latency)
+        return FakeResult(list(self._data))
+
+
+class FakeClient:
+    """Заглушка AsyncClient с задержкой latency на каждый запрос"""
+
+    def __init__(self, latency: float, blocking: bool):
+        self.latency = latency
+        self.blocking = blocking
+        self.queries = 0
+
+    def table(self, name: str):
+        return FakeQuery(self, [PROJECT] if name == "projects" else [])
+
+    def rpc(self, name: str, params: dict):
+        return FakeQuery(self, [{"new_score": PROJECT["score"] + 5, "updated": False}])
+
+
+async def handle_update(user_id: int):
+    project = await db.get_project(PROJECT["id"])
+    await asyncio.gather(
+        db.get_user_action(user_id, project["id"], "review"),
+        db.list_history(project["id"], limit=2),
+    )
+    await db.submit_review(project["id"], user_id, f"user{user_id}", "отзыв", 5)
+
+
+async def run(updates: int, latency: float, blocking: bool):
+    db._client = FakeClient(latency, blocking)
+    timings = []
+
+    async def timed(user_id: int):
+        start = time.perf_counter()
+        await handle_update(user_id)
+        timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(timed(user_id) for user_id in range(updates)))
+    elapsed = time.perf_counter() - start
+    timings.sort()
+    return {
+        "rate": updates / elapsed,
+        "p50": timings[len(timings) // 2],
+        "max": timings[-1],
+        "queries": db._client.queries,
+    }
+
+
+def report(title: str, stats: dict):
+    print(f"{title:<28} {stats['rate']:8.1f} апдейтов/с  "
+          f"p50 {stats['p50'] * 1000:7.0f} мс  max {stats['max'] * 1000:7.0f} мс  запросов: {stats['queries']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.03, help="задержка одного запроса, сек")
+    args = parser.parse_args()
+
+    before = asyncio.run(run(args.updates, args.latency, blocking=True))
+    after = asyncio.run(run(args.updates, args.latency, blocking=False))
+
+    print(f"Апдейтов: {args.updates}, задержка запроса: {args.latency * 1000:.0f} мс")
+    report("До (синхронный клиент):", before)
+    report("После (асинхронный клиент):", after)
+    print(f"Ускорение: x{after['rate'] / before['rate']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
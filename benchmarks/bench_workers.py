@@ -0,0 +1,108 @@
+"""Бенчмарк: пропускная способность при разном числе воркеров (backend/workers.py).
+
+Каждый апдейт имитирует хендлер: CPU-работа (сборка HTML карточек) плюс
+ожидание базы. Апдейты раздаются воркерам по user_id, как в боте. Заодно
+проверяется, что апдейты каждого пользователя обработаны по порядку.
+
+Запуск: python benchmarks/bench_workers.py [--updates 2000] [--users 200] [--workers 1 2 4]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+from html import escape
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from workers import WorkerPool, consume_updates  # noqa: E402
+
+
+def render_cards(cards: int) -> str:
+    """CPU-часть хендлера: HTML нескольких карточек проектов"""
+    text = ""
+    for i in range(cards):
+        text += f"<b>{escape(f'Проект <{i}>')}</b>\n\n{escape('описание ' * 40)[:150]}...\n⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯\n"
+    return text
+
+
+class FakeDispatcher:
+    def __init__(self, cards: int, latency: float):
+        self.cards = cards
+        self.latency = latency
+        self.seen = {}  # user_id -> seq последних апдейтов
+        self.out_of_order = 0
+
+    async def feed_raw_update(self, bot, update: dict):
+        message = update["message"]
+        user_id = message["from"]["id"]
+        if message["seq"] < self.seen.get(user_id, -1):
+            self.out_of_order += 1
+        self.seen[user_id] = message["seq"]
+        for _ in range(5):
+            render_cards(self.cards)
+        await asyncio.sleep(self.latency)
+
+
+async def bench_worker(index: int, queue, results, cards: int, latency: float):
+    dp = FakeDispatcher(cards, latency)
+    results.put(("ready", index))
+    await consume_updates(dp, None, queue)
+    results.put(("done", dp.out_of_order))
+
+
+def make_updates(count: int, users: int):
+    updates = []
+    seq = {}
+    for update_id in range(count):
+        user_id = 1000 + update_id % users
+        seq[user_id] = seq.get(user_id, -1) + 1
+        updates.append({
+            "update_id": update_id,
+            "message": {"from": {"id": user_id}, "chat": {"id": user_id}, "seq": seq[user_id]},
+        })
+    return updates
+
+
+async def run(workers: int, updates, cards: int, latency: float):
+    results = multiprocessing.get_context("spawn").Queue()
+    pool = WorkerPool(bench_worker, workers, args=(results, cards, latency))
+    pool.start()
+    for _ in range(workers):
+        await asyncio.to_thread(results.get)  # ждем запуска всех процессов
+
+    start = time.perf_counter()
+    for update in updates:
+        pool.dispatch(update)
+    await pool.stop()
+    elapsed = time.perf_counter() - start
+
+    out_of_order = 0
+    for _ in range(workers):
+        _, count = await asyncio.to_thread(results.get)
+        out_of_order += count
+    return len(updates) / elapsed, out_of_order
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--cards", type=int, default=40, help="карточек на апдейт (CPU)")
+    parser.add_argument("--latency", type=float, default=0.02, help="ожидание базы на апдейт, с")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    updates = make_updates(args.updates, args.users)
+    print(f"Апдейтов: {args.updates}, пользователей: {args.users}, CPU на апдейт: {args.cards * 5} карточек")
+    baseline = None
+    for workers in args.workers:
+        rate, out_of_order = asyncio.run(run(workers, updates, args.cards, args.latency))
+        baseline = baseline or rate
+        print(f"воркеров: {workers:<3} {rate:8.1f} апдейтов/с  x{rate / baseline:.2f}  "
+              f"нарушений порядка: {out_of_order}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,5 +5,16 @@ module.exports = {
     env: {
       NODE_ENV: 'production',
     }
+  }, {
+    // API для Mini App: uvicorn с несколькими процессами (см. backend/api.py)
+    name: 'tma-api',
+    script: 'api.py',
+    cwd: './backend',
+    interpreter: 'python3',
+    env: {
+      API_PORT: 8000,
+      API_WORKERS: 4,
+      API_DB_CONCURRENCY: 20,
+    }
   }]
 }